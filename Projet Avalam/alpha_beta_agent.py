@@ -0,0 +1,99 @@
+"""
+Avalam agent.
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; version 2 of the License.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+Recherche alpha-beta par approfondissement itératif
+"""
+
+from numpy import array, int64
+from avalam import agent_main
+from njitavalam import Board, PLAYER1
+from time_manager import TimeManager
+from time_safe_alarm import TimeSafeAgent
+from endgame_solver import solve, ROOT_THRESHOLD
+from alpha_beta_search import SearchContext, iterative_deepening, DEFAULT_TABLE_SIZE, DEFAULT_ASPIRATION
+
+class AlphaBetaAgent(TimeSafeAgent):
+    """
+     Agent based on iterative deepening alpha-beta search
+    """
+
+    def __init__(self, table_size:int=DEFAULT_TABLE_SIZE, pvs:bool=True, aspiration:float=DEFAULT_ASPIRATION):
+        self.context = SearchContext(table_size, pvs)
+        self.aspiration = aspiration
+        self.time_manager = TimeManager()
+
+    def initialize(self, percepts, players, time_left):
+        """
+        Begin a new game, the table of the previous game is discarded
+        """
+        self.context.clear()
+
+    def get_action(self, board:Board, player:int, step:int, time_left:int):
+        """
+        Get an action
+        :param percepts: dictionary representing the current board
+        :param player: the player to control in this step (-1 or 1)
+        :param step: the current step
+        :param time_left: the time left for the agent to play
+        :return: the code of the action to play (njitavalam.encode_action)
+        """
+        if board.n_actions <= ROOT_THRESHOLD:
+            # the end of the game is small enough to be solved exactly
+            return solve(board, player)[1]
+        time_budget = self.time_manager.turn_budget(time_left, board.n_actions)
+        action, _, _ = iterative_deepening(board, player, time_budget, self.context, aspiration=self.aspiration)
+        return action
+
+def add_arguments(_, parser):
+    """
+    Add the options of the agent to the command line
+    """
+    parser.add_argument("--no-pvs", action="store_true",
+                        help="search all the moves with the full window (default: principal variation search)")
+    parser.add_argument("--aspiration", type=float, default=DEFAULT_ASPIRATION, metavar="WINDOW",
+                        help="half width of the aspiration window around the value of the previous iteration, "
+                             "0 for the full window (default: %(default)s)")
+
+def setup_agent(agent:AlphaBetaAgent, _, args):
+    """
+    Configure the agent from the command line options
+    """
+    agent.context.pvs = not args.no_pvs
+    agent.aspiration = args.aspiration if args.aspiration > 0 else None
+
+if __name__ == "__main__":
+    my_agent = AlphaBetaAgent()
+    percepts = { "m":[ [ 0,  0,  1, -1,  0,  0,  0,  0,  0],
+                                [ 0,  1, -1,  1, -1,  0,  0,  0,  0],
+                                [ 0, -1,  1, -1,  1, -1,  1,  0,  0],
+                                [ 0,  1, -1,  1, -1,  1, -1,  1, -1],
+                                [ 1, -1,  1, -1,  0, -1,  1, -1,  1],
+                                [-1,  1, -1,  1, -1,  1, -1,  1,  0],
+                                [ 0,  0,  1, -1,  1, -1,  1, -1,  0],
+                                [ 0,  0,  0,  0, -1,  1, -1,  1,  0],
+                                [ 0,  0,  0,  0,  0, -1,  1,  0,  0] ]
+                , "max_height": 5 }
+    # first move to compile the numba functions before the game
+    my_agent.play(percepts=percepts, player=PLAYER1, step=1, time_left=30)
+    my_agent.initialize(percepts, None, None)
+    endgame = array([[0, 0, 1, -1] + [0] * 5] + [[0] * 9] * 8, dtype=int64)
+    solve(Board(endgame, 5), PLAYER1)
+    try:
+        agent_main(my_agent, add_arguments, setup_agent)
+    except Exception as error: # pylint: disable=broad-except
+        print(error)
+        print("Error in agent_main")
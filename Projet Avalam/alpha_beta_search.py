@@ -0,0 +1,362 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Recherche alpha-beta par approfondissement itératif.
+Le negamax est compilé avec numba et joue les actions sur un seul plateau
+(play_code_undoable / undo). Les coups sont ordonnés par le coup de la table
+de transposition, les deux coups meurtriers (killers) de la profondeur puis
+l'historique. La table de transposition est de taille fixe et garde la
+profondeur, le type de borne et le meilleur coup de chaque position.
+
+Une itération est interrompue lorsqu'elle dépasse le nombre de noeuds que le
+temps restant permet de visiter ou l'heure limite de la recherche (vérifiée
+tous les TIME_CHECK_INTERVAL noeuds), le coup de la dernière itération
+complète est alors joué.
+
+Deux options réduisent le nombre de noeuds visités:
+- la recherche de la variation principale (PVS), les coups suivant le premier
+  sont cherchés avec une fenêtre nulle et recherchés avec la fenêtre complète
+  seulement s'ils la dépassent;
+- les fenêtres d'aspiration, chaque itération est cherchée dans une fenêtre
+  autour de la valeur de l'itération précédente et recherchée avec une fenêtre
+  ouverte du côté où la valeur en sort.
+"""
+
+from time import time
+from numba import njit, objmode
+from numba.experimental import jitclass
+from numba.types import int64, uint64, int8, float64, boolean
+import numpy as np
+from njitavalam import N_CELLS, N_ACTION_CODES
+from endgame_solver import position_key, EXACT, LOWER_BOUND, UPPER_BOUND
+
+DEFAULT_TABLE_SIZE = 2**20
+# maximum depth of the search (a game has less than N_CELLS moves)
+MAX_DEPTH = N_CELLS
+# value of a won game, the final score is added to it
+WIN_VALUE = 1000.0
+# value of a tower that can no longer move nor be covered
+ISOLATED_WEIGHT = 1.0
+# move ordering scores
+HASH_MOVE_SCORE = 2**62
+KILLER_SCORE = 2**61
+# an iteration is not started if it is expected to take more than the time left
+BRANCHING_ESTIMATE = 4.0
+# the speed of the search is measured on iterations visiting more nodes than this
+MIN_MEASURE_NODES = 10000
+# the clock is read every TIME_CHECK_INTERVAL nodes (a power of two)
+TIME_CHECK_INTERVAL = 4096
+# width of the null window of PVS (smaller than the difference between two values)
+NULL_WINDOW = 0.01
+# half width of the aspiration window (about one tower)
+DEFAULT_ASPIRATION = 1.5
+
+@jitclass([
+    ('keys', uint64[:]),
+    ('depths', int64[:]),
+    ('values', float64[:]),
+    ('flags', int8[:]),
+    ('moves', int64[:]),
+    ('killers', int64[:,:]),
+    ('history', int64[:,:]),
+    ('nodes', int64),
+    ('max_nodes', int64),
+    ('deadline', float64),
+    ('aborted', boolean),
+    ('nodes_per_second', float64),
+    ('pvs', boolean),
+])
+class SearchContext:
+    """
+    Table de transposition et heuristiques d'ordonnancement de la recherche
+    La case key % size de la table contient la profondeur, la valeur (pour le
+    joueur qui doit jouer), le type de borne et le meilleur coup de la
+    dernière position cherchée avec cet index.
+    killers[ply] sont les deux derniers coups ayant causé une coupure à la
+    profondeur ply, history[joueur][code] le score d'historique du coup.
+    La recherche s'arrête (aborted) lorsque nodes atteint max_nodes ou que
+    l'heure (time()) dépasse deadline.
+    nodes_per_second est la vitesse mesurée de la recherche (0: inconnue).
+    pvs active la recherche de la variation principale.
+    """
+    def __init__(self, size:int, pvs:bool=False):
+        self.keys = np.zeros(size, dtype=np.uint64)
+        self.depths = np.zeros(size, dtype=np.int64)
+        self.values = np.zeros(size, dtype=np.float64)
+        self.flags = np.full(size, -1, dtype=np.int8)
+        self.moves = np.full(size, -1, dtype=np.int64)
+        self.killers = np.full((MAX_DEPTH + 1, 2), -1, dtype=np.int64)
+        self.history = np.zeros((2, N_ACTION_CODES), dtype=np.int64)
+        self.nodes = 0
+        self.max_nodes = 0
+        self.deadline = np.inf
+        self.aborted = False
+        self.nodes_per_second = 0.0
+        self.pvs = pvs
+
+    def new_search(self):
+        """
+        Forget the killers and age the history before the search of a new position
+        """
+        self.killers[:, :] = -1
+        self.history //= 8
+
+    def clear(self):
+        """
+        Forget everything
+        """
+        self.flags[:] = -1
+        self.killers[:, :] = -1
+        self.history[:, :] = 0
+
+@njit()
+def clock():
+    """
+    Returns time() from compiled code
+    """
+    with objmode(now='float64'):
+        now = time()
+    return now
+
+@njit()
+def terminal_value(score:int):
+    """
+    Returns the value of a finished game (score of njitavalam.Board.get_score)
+    """
+    if score > 0:
+        return WIN_VALUE + score
+    if score < 0:
+        return -WIN_VALUE + score
+    return 0.0
+
+@njit()
+def evaluate(board):
+    """
+    Returns the heuristic value of the board (<0: red, >0: yellow)
+    Each tower counts for its colour, towers without valid moves are
+    isolated and will stay until the end, they count ISOLATED_WEIGHT more
+    """
+    value = 0.0
+    for cell in range(N_CELLS):
+        tower = board.cells[cell]
+        if tower != 0:
+            colour = 1.0 if tower > 0 else -1.0
+            value += colour
+            if board.tower_actions[cell] == 0:
+                value += ISOLATED_WEIGHT * colour
+    return value
+
+@njit()
+def order_moves(board, player:int, ply:int, hash_move:int, context:SearchContext):
+    """
+    Returns the action codes of the board, the hash move first, then the
+    killers of the ply, then by decreasing history
+    """
+    codes = board.get_action_codes()
+    scores = np.empty(len(codes), dtype=np.int64)
+    side = (player + 1) // 2
+    for index, code in enumerate(codes):
+        if code == hash_move:
+            scores[index] = HASH_MOVE_SCORE
+        elif code == context.killers[ply, 0]:
+            scores[index] = KILLER_SCORE
+        elif code == context.killers[ply, 1]:
+            scores[index] = KILLER_SCORE - 1
+        else:
+            scores[index] = context.history[side, code]
+    return codes[np.argsort(-scores, kind="mergesort")]
+
+@njit()
+def store(context:SearchContext, key, depth:int, value:float, flag:int, move:int):
+    """
+    Store a position in the table, a deeper search of the same position is kept
+    """
+    index = key % np.uint64(len(context.keys))
+    if context.flags[index] >= 0 and context.keys[index] == key and context.depths[index] > depth:
+        return
+    context.keys[index] = key
+    context.depths[index] = depth
+    context.values[index] = value
+    context.flags[index] = flag
+    context.moves[index] = move
+
+@njit()
+def negamax(board, player:int, depth:int, ply:int, alpha:float, beta:float, context:SearchContext):
+    """
+    Returns the value of the board for player (player * value) searched at
+    depth if it is between alpha and beta, a bound otherwise
+    """
+    context.nodes += 1
+    if context.nodes >= context.max_nodes or \
+            (context.nodes % TIME_CHECK_INTERVAL == 0 and clock() >= context.deadline):
+        context.aborted = True
+        return 0.0
+    if board.is_finished():
+        return player * terminal_value(board.get_score())
+    if depth <= 0:
+        return player * evaluate(board)
+
+    key = position_key(board, player)
+    index = key % np.uint64(len(context.keys))
+    hash_move = -1
+    if context.flags[index] >= 0 and context.keys[index] == key:
+        hash_move = context.moves[index]
+        if context.depths[index] >= depth:
+            value = context.values[index]
+            if context.flags[index] == EXACT:
+                return value
+            if context.flags[index] == LOWER_BOUND and value > alpha:
+                alpha = value
+            elif context.flags[index] == UPPER_BOUND and value < beta:
+                beta = value
+            if alpha >= beta:
+                return value
+
+    original_alpha = alpha
+    best_value = -np.inf
+    best_move = -1
+    for code in order_moves(board, player, ply, hash_move, context):
+        token = board.play_code_undoable(code)
+        if best_move < 0 or not context.pvs:
+            value = -negamax(board, -player, depth - 1, ply + 1, -beta, -alpha, context)
+        else:
+            # the first move is expected to be the best, the others only have to be refuted
+            value = -negamax(board, -player, depth - 1, ply + 1, -alpha - NULL_WINDOW, -alpha, context)
+            if alpha < value < beta and not context.aborted:
+                value = -negamax(board, -player, depth - 1, ply + 1, -beta, -alpha, context)
+        board.undo(token)
+        if context.aborted:
+            return 0.0
+        if value > best_value:
+            best_value = value
+            best_move = code
+        if value > alpha:
+            alpha = value
+        if alpha >= beta:
+            if context.killers[ply, 0] != code:
+                context.killers[ply, 1] = context.killers[ply, 0]
+                context.killers[ply, 0] = code
+            context.history[(player + 1) // 2, code] += depth * depth
+            break
+
+    if best_value <= original_alpha:
+        flag = UPPER_BOUND
+    elif best_value >= beta:
+        flag = LOWER_BOUND
+    else:
+        flag = EXACT
+    store(context, key, depth, best_value, flag, best_move)
+    return best_value
+
+@njit()
+def search_root(board, player:int, depth:int, context:SearchContext, alpha:float=-np.inf, beta:float=np.inf):
+    """
+    Returns the value of the board for player searched at depth in the window
+    (alpha, beta) and the best action code (read in the table)
+    """
+    value = negamax(board, player, depth, 0, alpha, beta, context)
+    key = position_key(board, player)
+    return value, context.moves[key % np.uint64(len(context.keys))]
+
+def aspiration_search(board, player:int, depth:int, context:SearchContext, guess:float, window:float):
+    """
+    Returns the value and the best action code of the board searched at depth
+    in the window (guess - window, guess + window), searched again with the
+    window open on the side of the value if it is outside
+    """
+    alpha, beta = guess - window, guess + window
+    while True:
+        value, move = search_root(board, player, depth, context, alpha, beta)
+        if context.aborted:
+            return value, move
+        if value <= alpha:
+            alpha = -np.inf
+        elif value >= beta:
+            beta = np.inf
+        else:
+            return value, move
+
+def iterative_deepening(board, player:int, time_budget:float, context:SearchContext,
+                        max_depth:int=MAX_DEPTH, aspiration:float=None):
+    """
+    Search the board at depth 1, 2, ... during time_budget seconds
+    Returns the best action code, the depth and the value of the last
+    completed iteration, context.nodes counts the visited positions
+    aspiration is the half width of the aspiration window (None: full window)
+    """
+    start_time = time()
+    context.new_search()
+    context.nodes = 0
+    context.deadline = start_time + time_budget
+    best_move, best_depth, best_value = board.get_nth_action_code(0), 0, 0.0
+    # the game ends in less moves than there are towers
+    max_depth = min(max_depth, int(np.count_nonzero(board.cells)) - 1)
+    for depth in range(1, max_depth + 1):
+        iteration_start = time()
+        elapsed = iteration_start - start_time
+        remaining = time_budget - elapsed
+        if remaining <= 0:
+            break
+        context.aborted = False
+        # the iteration is limited to the nodes we can visit in the remaining time
+        iteration_nodes = context.nodes
+        context.max_nodes = 2**62
+        if context.nodes_per_second > 0:
+            context.max_nodes = context.nodes + int(min(context.nodes_per_second * remaining, 2**61))
+        if aspiration is None or best_depth == 0:
+            value, move = search_root(board, player, depth, context)
+        else:
+            value, move = aspiration_search(board, player, depth, context, best_value, aspiration)
+        if context.aborted:
+            break
+        best_move, best_depth, best_value = move, depth, value
+        iteration_time = time() - iteration_start
+        if context.nodes - iteration_nodes >= MIN_MEASURE_NODES and iteration_time > 0:
+            context.nodes_per_second = (context.nodes - iteration_nodes) / iteration_time
+        if abs(value) >= WIN_VALUE:
+            break
+        if iteration_time * BRANCHING_ESTIMATE > time_budget - (time() - start_time):
+            break
+    return best_move, best_depth, best_value
+
+if __name__ == "__main__":
+    from random import seed
+    from njitavalam import Board as AvalamState, YELLOW
+    from endgame_solver import random_positions
+    from graveyard.minimax_njit_search import alpha_beta_pruning_algo
+
+    @njit()
+    def baseline_evaluation(state, player, step):
+        """
+        The evaluation of the variants with the heuristic signature of the njit minimax
+        """
+        return evaluate(state)
+
+    seed(8215)
+    suite = [(AvalamState(), YELLOW)] + random_positions(150, 4) + random_positions(80, 5)
+    variants = (("alpha-beta", False, None), ("PVS", True, None),
+                ("aspiration", False, DEFAULT_ASPIRATION), ("PVS+aspiration", True, DEFAULT_ASPIRATION))
+    search_context = SearchContext(DEFAULT_TABLE_SIZE)
+    iterative_deepening(suite[-1][0], suite[-1][1], np.inf, search_context, max_depth=2)
+    names = ["baseline"] + [name for name, _, _ in variants]
+    widths = [max(len(name), 8) for name in names]
+    print("nodes visited on the whole suite, all with the same evaluation (evaluate)")
+    print("baseline: one fixed-depth minimax search per position, without table nor quiescence")
+    print("variants: all the iterations of iterative deepening up to the depth, table hits included")
+    print("depth | " + " | ".join(f"{name:>{width}}" for name, width in zip(names, widths)))
+    for search_depth in (2, 3, 4):
+        counter = np.zeros(1, dtype=np.int64)
+        # equal depth: the baseline stops at the cutoff like the variants
+        for position, player_to_move in suite:
+            alpha_beta_pruning_algo(position, player_to_move, search_depth - 1, 1, baseline_evaluation,
+                                    nodes=counter, quiescence=False)
+        counts = [counter[0]]
+        for _, use_pvs, window in variants:
+            total = 0
+            for position, player_to_move in suite:
+                search_context = SearchContext(DEFAULT_TABLE_SIZE, use_pvs)
+                iterative_deepening(position, player_to_move, np.inf, search_context, search_depth, window)
+                total += search_context.nodes
+            counts.append(total)
+        print(f"{search_depth:5d} | " + " | ".join(f"{count:{width}d}" for count, width in zip(counts, widths)))
@@ -0,0 +1,401 @@
+"""
+  Avalam numba compatible, bitboard representation
+
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Les 48 cases jouables du plateau tiennent dans un uint64. Le plateau est
+représenté par un masque des cases occupées, un masque des tours jaunes et un
+masque par hauteur de tour. La génération des actions se fait avec des masques
+de voisins précalculés.
+"""
+
+from numba import njit
+from numba.cpython.unsafe.numbers import trailing_zeros
+from numba.experimental import jitclass
+from numba.types import int64, uint64, optional, Tuple
+import numpy as np
+from njitavalam import (ZOBRIST, ZOBRIST_MAX_HEIGHT, INITIAL_BOARD, CELL_ROWS, CELL_COLUMNS, N_CELLS,
+                        CELL_INDEX, CELL_ZOBRIST, NEIGHBOURS, encode_action, decode_action)
+
+# (negative for red, positive for yellow)
+# this score represents the winner (<0: red, >0: yellow, 0: draw).
+PLAYER1 = 1 # yellow
+PLAYER2 = -1 # red
+YELLOW = PLAYER1
+RED = PLAYER2
+
+EMPTY_BOARD = np.zeros((9, 9), dtype=np.int64)
+
+CELL_BITS = np.array([1 << cell for cell in range(N_CELLS)], dtype=np.uint64)
+
+def _neighbour_masks():
+    masks = np.zeros(N_CELLS, dtype=np.uint64)
+    for cell in range(N_CELLS):
+        for neighbour in NEIGHBOURS[cell]:
+            if neighbour >= 0:
+                masks[cell] |= CELL_BITS[neighbour]
+    return masks
+
+NEIGHBOUR_MASKS = _neighbour_masks()
+
+@njit()
+def popcount(mask):
+    """
+    Returns the number of bits set in a uint64 mask
+    """
+    mask = mask - ((mask >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    mask = (mask & np.uint64(0x3333333333333333)) + ((mask >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    mask = (mask + (mask >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return int64((mask * np.uint64(0x0101010101010101)) >> np.uint64(56))
+
+@jitclass([
+    ('max_height', int64),
+    ('rows', int64),
+    ('columns', int64),
+    ('occupied', uint64),
+    ('yellow', uint64),
+    ('heights', uint64[:]),
+    ('key', uint64),
+    ('last_action', optional(Tuple([int64, int64, int64, int64]))),
+])
+class Board:
+
+    """Representation of an Avalam Board as bitboards.
+
+    self.occupied has a bit set for every non-empty cell, self.yellow for every
+    tower owned by yellow and self.heights[h] for every tower of height h. The
+    bit of a cell is given by CELL_INDEX. The API is the same as
+    njitavalam.Board, including the Zobrist key self.key.
+    """
+
+    def __init__(self, percepts=INITIAL_BOARD, max_height=5, invert=False) -> None:
+        """Initialize the board.
+
+        Arguments:
+        percepts -- matrix representing the board
+        invert -- whether to invert the sign of all values, inverting the
+            players
+        max_height -- maximum height of a tower
+
+        """
+        self.rows = len(percepts)
+        self.columns = len(percepts[0])
+        self.max_height = max_height
+        self.occupied = np.uint64(0)
+        self.yellow = np.uint64(0)
+        self.heights = np.zeros(max_height + 1, dtype=np.uint64)
+        for cell in range(N_CELLS):
+            value = percepts[CELL_ROWS[cell]][CELL_COLUMNS[cell]]
+            if invert:
+                value = -value
+            if value != 0:
+                self.occupied |= CELL_BITS[cell]
+                self.heights[abs(value)] |= CELL_BITS[cell]
+                if value > 0:
+                    self.yellow |= CELL_BITS[cell]
+        self.last_action = None
+        self.key = self.compute_key()
+
+    def __str__(self) -> str:
+        def str_cell(i, j):
+            x = self.get_cell(i, j) # pylint: disable=invalid-name
+            if x:
+                return "%+2d" % x
+            else:
+                return " ."
+        return "\n".join(" ".join(str_cell(i, j) for j in range(self.columns))
+                         for i in range(self.rows))
+
+    @property
+    def m(self): # pylint: disable=invalid-name
+        """Matrix representation of the board (see njitavalam.Board.m)"""
+        return self.get_percepts(False)
+
+    def clone(self):
+        """Return a clone of this object."""
+        board = Board(EMPTY_BOARD, self.max_height, False)
+        board.occupied = self.occupied
+        board.yellow = self.yellow
+        board.heights[:] = self.heights
+        board.key = self.key
+        board.last_action = self.last_action
+        return board
+
+    def get_height(self, cell):
+        """Return the height of the tower on the given cell index"""
+        bit = CELL_BITS[cell]
+        if not self.occupied & bit:
+            return 0
+        for height in range(1, self.max_height + 1):
+            if self.heights[height] & bit:
+                return height
+        return 0
+
+    def get_cell(self, i, j):
+        """Return the value of cell (i,j) as in the percepts matrix"""
+        cell = CELL_INDEX[i][j]
+        if cell < 0:
+            return 0
+        height = self.get_height(cell)
+        if self.yellow & CELL_BITS[cell]:
+            return height
+        return -height
+
+    def get_cells(self):
+        """Return the towers of the playable cells (see njitavalam.Board.cells)"""
+        cells = np.zeros(N_CELLS, dtype=np.int8)
+        for cell in range(N_CELLS):
+            cells[cell] = self.get_cell(CELL_ROWS[cell], CELL_COLUMNS[cell])
+        return cells
+
+    def compute_key(self):
+        """Return the Zobrist key of the position (same as njitavalam.Board.key)"""
+        key = np.uint64(0)
+        for cell in range(N_CELLS):
+            i, j = CELL_ROWS[cell], CELL_COLUMNS[cell]
+            key ^= ZOBRIST[i][j][self.get_cell(i, j) + ZOBRIST_MAX_HEIGHT]
+        return key
+
+    def get_percepts(self, invert=False):
+        """Return the percepts corresponding to the current state.
+
+        If invert is True, the sign of all values is inverted to get the view
+        of the other player.
+
+        """
+        mul = PLAYER1
+        if invert:
+            mul = PLAYER2
+        percepts = np.zeros((self.rows, self.columns), dtype=np.int64)
+        for cell in range(N_CELLS):
+            percepts[CELL_ROWS[cell]][CELL_COLUMNS[cell]] = mul * self.get_cell(CELL_ROWS[cell], CELL_COLUMNS[cell])
+        return percepts
+
+    def get_towers(self):
+        """Yield all towers.
+
+        Yield the towers as triplets (i, j, h):
+        i -- row number of the tower
+        j -- column number of the tower
+        h -- height of the tower (absolute value) and owner (sign)
+
+        """
+        for cell in range(N_CELLS):
+            if self.occupied & CELL_BITS[cell]:
+                yield (CELL_ROWS[cell], CELL_COLUMNS[cell], self.get_cell(CELL_ROWS[cell], CELL_COLUMNS[cell]))
+
+    def fitting_mask(self, height):
+        """Return the mask of the towers a tower of the given height can gobble"""
+        mask = np.uint64(0)
+        for other_height in range(1, self.max_height - height + 1):
+            mask |= self.heights[other_height]
+        return mask
+
+    def get_tower_actions(self, i, j):
+        """Yield all actions with moving tower (i,j)"""
+        cell = CELL_INDEX[i][j]
+        if cell >= 0:
+            h = self.get_height(cell) # pylint: disable=invalid-name
+            if 0 < h < self.max_height:
+                targets = NEIGHBOUR_MASKS[cell] & self.fitting_mask(h)
+                while targets:
+                    target = trailing_zeros(targets)
+                    targets &= targets - np.uint64(1)
+                    yield (i, j, CELL_ROWS[target], CELL_COLUMNS[target])
+
+    def get_actions(self):
+        """Return all valid actions on this board."""
+        actions = []
+        for h in range(1, self.max_height): # pylint: disable=invalid-name
+            fits = self.fitting_mask(h)
+            sources = self.heights[h]
+            while sources:
+                source = trailing_zeros(sources)
+                sources &= sources - np.uint64(1)
+                targets = NEIGHBOUR_MASKS[source] & fits
+                while targets:
+                    target = trailing_zeros(targets)
+                    targets &= targets - np.uint64(1)
+                    actions.append((CELL_ROWS[source], CELL_COLUMNS[source],
+                                    CELL_ROWS[target], CELL_COLUMNS[target]))
+        return actions
+
+    @property
+    def n_actions(self):
+        """Number of valid actions on this board"""
+        n_actions = 0
+        for h in range(1, self.max_height): # pylint: disable=invalid-name
+            fits = self.fitting_mask(h)
+            sources = self.heights[h]
+            while sources:
+                source = trailing_zeros(sources)
+                sources &= sources - np.uint64(1)
+                n_actions += popcount(NEIGHBOUR_MASKS[source] & fits)
+        return n_actions
+
+    def get_nth_action(self, n):
+        """Return the n-th action of get_actions() without building the list"""
+        for h in range(1, self.max_height): # pylint: disable=invalid-name
+            fits = self.fitting_mask(h)
+            sources = self.heights[h]
+            while sources:
+                source = trailing_zeros(sources)
+                sources &= sources - np.uint64(1)
+                targets = NEIGHBOUR_MASKS[source] & fits
+                count = popcount(targets)
+                if n >= count:
+                    n -= count
+                    continue
+                for _ in range(n):
+                    targets &= targets - np.uint64(1)
+                target = trailing_zeros(targets)
+                return (CELL_ROWS[source], CELL_COLUMNS[source], CELL_ROWS[target], CELL_COLUMNS[target])
+        return (0, 0, 0, 0)
+
+    def play_action(self, action):
+        """Play an action if it is valid.
+
+        An action is a 4-uple containing the row and column of the tower to
+        move and the row and column of the tower to gobble. If the action is
+        invalid, the board is left unchanged. Return self.
+
+        """
+        self.play_action_undoable(action)
+        return self
+
+    def get_action_codes(self):
+        """Return the codes of all valid actions (see njitavalam.encode_action)"""
+        actions = self.get_actions()
+        codes = np.empty(len(actions), dtype=np.int64)
+        for n, action in enumerate(actions):
+            codes[n] = encode_action(action)
+        return codes
+
+    def get_nth_action_code(self, n):
+        """Return the code of the n-th action of get_actions()"""
+        return encode_action(self.get_nth_action(n))
+
+    def play_code(self, code):
+        """Play the action of a code given by get_action_codes(). Return self."""
+        return self.play_action(decode_action(code))
+
+    def play_code_undoable(self, code):
+        """Play the action of a code and return the undo token"""
+        return self.play_action_undoable(decode_action(code))
+
+    def play_action_undoable(self, action):
+        """Play an action if it is valid and return the undo token (see
+        njitavalam.Board.play_action_undoable)."""
+        last_action = self.last_action
+        if last_action is None:
+            last_action = (-1, -1, -1, -1)
+        if not self.is_action_valid(action):
+            return (-1, -1, 0, 0) + last_action
+        i1, j1, i2, j2 = action # pylint: disable=invalid-name
+        source = CELL_INDEX[i1][j1]
+        target = CELL_INDEX[i2][j2]
+        h1 = self.get_height(source) # pylint: disable=invalid-name
+        h2 = self.get_height(target) # pylint: disable=invalid-name
+        source_bit = CELL_BITS[source]
+        target_bit = CELL_BITS[target]
+        source_value = self.get_cell(i1, j1)
+        target_value = h1 + h2 if source_value > 0 else -(h1 + h2)
+        token = (source, target, source_value, self.get_cell(i2, j2)) + last_action
+        self.key ^= ZOBRIST[i1][j1][source_value + ZOBRIST_MAX_HEIGHT]
+        self.key ^= ZOBRIST[i2][j2][self.get_cell(i2, j2) + ZOBRIST_MAX_HEIGHT]
+        self.key ^= ZOBRIST[i2][j2][target_value + ZOBRIST_MAX_HEIGHT]
+        self.heights[h1] &= ~source_bit
+        self.heights[h2] &= ~target_bit
+        self.heights[h1 + h2] |= target_bit
+        self.occupied &= ~source_bit
+        if self.yellow & source_bit:
+            self.yellow |= target_bit
+        else:
+            self.yellow &= ~target_bit
+        self.yellow &= ~source_bit
+        self.last_action = action
+        return token
+
+    def set_cell(self, cell, value):
+        """Put the tower value (as in the percepts matrix) on the cell index"""
+        bit = CELL_BITS[cell]
+        self.heights[self.get_height(cell)] &= ~bit
+        self.occupied &= ~bit
+        self.yellow &= ~bit
+        if value != 0:
+            self.heights[abs(value)] |= bit
+            self.occupied |= bit
+            if value > 0:
+                self.yellow |= bit
+
+    def undo(self, token):
+        """Restore the board as it was before the action of the undo token
+        given by play_action_undoable. Return self."""
+        source, target, source_value, target_value, i1, j1, i2, j2 = token # pylint: disable=invalid-name
+        if source < 0:
+            return self
+        self.key ^= CELL_ZOBRIST[target, self.get_cell(CELL_ROWS[target], CELL_COLUMNS[target]) + ZOBRIST_MAX_HEIGHT]
+        self.key ^= CELL_ZOBRIST[source, source_value + ZOBRIST_MAX_HEIGHT]
+        self.key ^= CELL_ZOBRIST[target, target_value + ZOBRIST_MAX_HEIGHT]
+        self.set_cell(source, source_value)
+        self.set_cell(target, target_value)
+        if i1 < 0:
+            self.last_action = None
+        else:
+            self.last_action = (i1, j1, i2, j2)
+        return self
+
+    def is_finished(self):
+        """Return whether no more moves can be made (i.e., game finished)."""
+        for h in range(1, self.max_height): # pylint: disable=invalid-name
+            fits = self.fitting_mask(h)
+            sources = self.heights[h]
+            while sources:
+                source = trailing_zeros(sources)
+                sources &= sources - np.uint64(1)
+                if NEIGHBOUR_MASKS[source] & fits:
+                    return False
+        return True
+
+    def get_score(self):
+        """Return a score for this board.
+
+        The score is the difference between the number of towers of each
+        player. In case of ties, it is the difference between the maximal
+        height towers of each player. If self.is_finished() returns True,
+        this score represents the winner (<0: red, >0: yellow, 0: draw).
+
+        """
+        red = self.occupied & ~self.yellow
+        score = popcount(self.yellow) - popcount(red)
+        if score == 0:
+            highest = self.heights[self.max_height]
+            score = popcount(highest & self.yellow) - popcount(highest & red)
+        return score
+
+    def is_tower_movable(self, i, j):
+        """Return wether tower (i,j) is movable"""
+        for _ in self.get_tower_actions(i, j):
+            return True
+        return False
+
+    def is_action_valid(self, action):
+        """Return whether action is a valid action."""
+
+        i1, j1, i2, j2 = action # pylint: disable=invalid-name
+        if i1 < 0 or j1 < 0 or i2 < 0 or j2 < 0 or \
+            i1 >= self.rows or j1 >= self.columns or \
+            i2 >= self.rows or j2 >= self.columns or \
+            (i1 == i2 and j1 == j2) or (abs(i1-i2) > 1) or (abs(j1-j2) > 1):
+            return False
+        source = CELL_INDEX[i1][j1]
+        target = CELL_INDEX[i2][j2]
+        if source < 0 or target < 0:
+            return False
+        h1 = self.get_height(source) # pylint: disable=invalid-name
+        h2 = self.get_height(target) # pylint: disable=invalid-name
+        if h1 <= 0 or h1 >= self.max_height or h2 <= 0 or \
+                h2 >= self.max_height or h1+h2 > self.max_height:
+            return False
+        return True
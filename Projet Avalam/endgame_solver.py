@@ -0,0 +1,165 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Résolution exacte des fins de partie d'Avalam.
+Negamax avec élagage alpha-beta compilé avec numba jusqu'à la fin de la partie,
+les positions déjà résolues sont conservées dans une table de transposition
+indexée par la clé de Zobrist du plateau (njitavalam.Board.key).
+"""
+
+from time import time
+from random import choice, seed
+from numba import njit
+from numba.experimental import jitclass
+from numba.types import int64, uint64, int8
+import numpy as np
+from njitavalam import Board as AvalamState, YELLOW, RED
+
+# the search of the MCTS is replaced by the solver below this number of actions
+ROOT_THRESHOLD = 24
+# the rollouts of the MCTS leaves are replaced by the solver below this number of actions
+LEAF_THRESHOLD = 8
+DEFAULT_TABLE_SIZE = 2**20
+
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+# key of the player to move, xored with the key of the board
+RED_KEY = np.uint64(0x9E3779B97F4A7C15)
+MAX_SCORE = 100
+
+@jitclass([
+    ('keys', uint64[:]),
+    ('values', int64[:]),
+    ('flags', int8[:]),
+    ('nodes', int64),
+])
+class SolverTable:
+    """
+    Table de transposition du solveur
+    La case key % size contient la valeur (pour le joueur qui doit jouer) et
+    le type de borne de la dernière position résolue avec cet index.
+    nodes compte les positions visitées.
+    """
+    def __init__(self, size:int):
+        self.keys = np.zeros(size, dtype=np.uint64)
+        self.values = np.zeros(size, dtype=np.int64)
+        self.flags = np.full(size, -1, dtype=np.int8)
+        self.nodes = 0
+
+@njit()
+def position_key(board, player:int):
+    """
+    Returns the key of the position with the player to move
+    """
+    if player == RED:
+        return board.key ^ RED_KEY
+    return board.key
+
+@njit()
+def negamax(board, player:int, alpha:int, beta:int, table:SolverTable):
+    """
+    Returns the exact final score of the board for player (player * score)
+    if it is between alpha and beta, a bound otherwise
+    """
+    table.nodes += 1
+    if board.is_finished():
+        return player * board.get_score()
+
+    key = position_key(board, player)
+    index = key % np.uint64(len(table.keys))
+    if table.flags[index] >= 0 and table.keys[index] == key:
+        value = table.values[index]
+        if table.flags[index] == EXACT:
+            return value
+        if table.flags[index] == LOWER_BOUND and value > alpha:
+            alpha = value
+        elif table.flags[index] == UPPER_BOUND and value < beta:
+            beta = value
+        if alpha >= beta:
+            return value
+
+    original_alpha = alpha
+    best_value = -MAX_SCORE
+    for code in board.get_action_codes():
+        token = board.play_code_undoable(code)
+        value = -negamax(board, -player, -beta, -alpha, table)
+        board.undo(token)
+        if value > best_value:
+            best_value = value
+        if value > alpha:
+            alpha = value
+        if alpha >= beta:
+            break
+
+    table.keys[index] = key
+    table.values[index] = best_value
+    if best_value <= original_alpha:
+        table.flags[index] = UPPER_BOUND
+    elif best_value >= beta:
+        table.flags[index] = LOWER_BOUND
+    else:
+        table.flags[index] = EXACT
+    return best_value
+
+@njit()
+def solve_board(board, player:int, table:SolverTable):
+    """
+    Returns the exact final score (<0: red, >0: yellow) and the best action code of player
+    """
+    best_value = -MAX_SCORE
+    best_action = -1
+    for code in board.get_action_codes():
+        token = board.play_code_undoable(code)
+        value = -negamax(board, -player, -MAX_SCORE, -best_value, table)
+        board.undo(token)
+        if value > best_value:
+            best_value = value
+            best_action = code
+    if best_value == -MAX_SCORE:
+        best_value = player * board.get_score()
+    return player * best_value, best_action
+
+_default_table = None
+
+def solve(board, player:int, table:SolverTable=None):
+    """
+    Returns the exact final score (<0: red, >0: yellow) and the best action
+    code of player. The table is kept between calls if none is given.
+    """
+    global _default_table # pylint: disable=global-statement,invalid-name
+    if table is None:
+        if _default_table is None:
+            _default_table = SolverTable(DEFAULT_TABLE_SIZE)
+        table = _default_table
+    return solve_board(board, player, table)
+
+def random_positions(n_actions:int, n_positions:int):
+    """
+    Returns positions with at most n_actions actions reached by random play,
+    with the player to move
+    """
+    positions = []
+    while len(positions) < n_positions:
+        board = AvalamState()
+        player = YELLOW
+        while board.n_actions > n_actions:
+            board.play_action(choice(board.get_actions()))
+            player = -player
+        if not board.is_finished():
+            positions.append((board, player))
+    return positions
+
+if __name__ == "__main__":
+    seed(8215)
+    solve(AvalamState(random_positions(4, 1)[0][0].get_percepts()), YELLOW)
+    print("actions | positions/s | nodes/position")
+    for max_actions in (4, 8, 12, 16, 20):
+        suite = random_positions(max_actions, 20)
+        solver_table = SolverTable(DEFAULT_TABLE_SIZE)
+        start_time = time()
+        for position, player_to_move in suite:
+            solve(position, player_to_move, solver_table)
+        elapsed = time() - start_time
+        print(f"{max_actions:7d} | {len(suite) / elapsed:11.1f} | {solver_table.nodes / len(suite):14.0f}")
@@ -16,8 +16,8 @@ action_type = Tuple([int64, int64, int64, int64])
 @njit()
 def predict_score(board:Board, action:tuple[int,int,int,int], player:int):
     x_from, y_from, x_to, y_to = action
-    h_from = board.m[x_from][y_from]
-    h_to = board.m[x_to][y_to]
+    h_from = board.get_cell(x_from, y_from)
+    h_to = board.get_cell(x_to, y_to)
     h = abs(h_from) + abs(h_to)
     if h==5 and h_from * player > 0:
         return inf
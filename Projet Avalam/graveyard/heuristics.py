@@ -5,10 +5,10 @@ Polytechnique Montréal
 """
 
 from numba import njit
-from njitavalam import Board as AvalamState
+from njitavalam import Board as AvalamState, N_CELLS, NEIGHBOURS
 from numpy import array, absolute
 
-
+@njit()
 def basic_heuristic(state: AvalamState):
     return state.get_score()
 
@@ -25,33 +25,28 @@ def heuristic_isolation(state:AvalamState, player:int)->int:
     estimated_score = 0
     score = 0
     n_towers = 0
-    for x in range(9):
-        for y in range(9):
-            if state.m[x][y]:
-                h = state.m[x][y]
-                n_towers += 1
+    for cell in range(N_CELLS):
+        h = state.cells[cell]
+        if h:
+            n_towers += 1
+            if h > 0:
+                score = 1
+            else:
+                score -= 1
+            h_abs = abs(h)
+            # the tower itself is part of its neighbourhood
+            is_not_isolated = 5 - h_abs <= h_abs and h_abs != 5
+            for neighbour in NEIGHBOURS[cell]:
+                if is_not_isolated:
+                    break
+                if neighbour >= 0 and h_abs != 5 and \
+                        (5-abs(state.cells[neighbour])) <= h_abs:
+                    is_not_isolated = True
+            if not is_not_isolated:
                 if h > 0:
-                    score = 1
+                    estimated_score += 1
                 else:
-                    score -= 1
-                i_min = max(0, x-1)
-                i_max = min(8, x+1)
-                j_min = max(0, y-1)
-                j_max = min(8, y+1)
-                is_not_isolated = False
-                h_abs = abs(h)
-                for i in range(i_min, i_max+1):
-                    for j in range(j_min, j_max+1):
-                        if (5-abs(state.m[i][j])) <= h_abs and h_abs!=5:
-                            is_not_isolated = True
-                            break
-                    if is_not_isolated:
-                        break
-                if not is_not_isolated:
-                    if h > 0:
-                        estimated_score += 1
-                    else:
-                        estimated_score -= 1
+                    estimated_score -= 1
     return estimated_score + score/n_towers
 
 @njit()
@@ -77,13 +72,14 @@ def get_all_player_towers(state: AvalamState, player: int):
 
 @njit()
 def is_player_tower_buried_by_action(state: AvalamState, player: int, action):
-    buried_tower = state.m[action[2]][action[3]]
+    buried_tower = state.get_cell(action[2], action[3])
     if buried_tower > 0 and player == 1:
         return True
     if buried_tower < 0 and player == -1:
         return True
     return False
 
+@njit()
 def heuristic_1(state: AvalamState, player: int)->float:
     TOWER_HEIGHT_INDEX = 2
     SCORE_FOR_MAX_TOWER = 1.2
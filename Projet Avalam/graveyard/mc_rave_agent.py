@@ -29,9 +29,9 @@ class MonteCarloRaveAgent(TimeSafeAgent):
 
         for action in board.get_actions():
             x_from, y_from, x_to, y_to = action
-            if abs(board.m[x_to][y_to]) + abs(board.m[x_from][y_from]) == 5:
-                if board.m[x_from][y_from] * player > 0:
-                    if board.m[x_to][y_to] * -player > 0:
+            if abs(board.get_cell(x_to, y_to)) + abs(board.get_cell(x_from, y_from)) == 5:
+                if board.get_cell(x_from, y_from) * player > 0:
+                    if board.get_cell(x_to, y_to) * -player > 0:
                         return action
 
         return monte_carlo_tree_search(board, player, step, time_left)
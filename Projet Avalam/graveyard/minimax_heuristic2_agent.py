@@ -4,12 +4,16 @@ Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
 Polytechnique Montréal
 """
 
+from os import makedirs, path
 from numpy import array, int64
-from graveyard.minimax_heuristic2_search import alpha_beta_pruning_search
+from graveyard.minimax_heuristic2_search import alpha_beta_pruning_search, cache
 from graveyard.random_actions import random_action
 from avalam import Agent, agent_main
 from njitavalam import PLAYER1, Board
 
+# Position cache kept from one run of the agent to the next
+CACHE_FILE = path.join("cachedir", "minimax_heuristic2_search.npz")
+
 class AlphaBetaPruningAgent(Agent):
     """
      Alpha-Beta Pruning agent
@@ -69,9 +73,13 @@ if __name__ == "__main__":
                                 [ 0,  0,  0,  0, -1,  1, -1,  1,  0],
                                 [ 0,  0,  0,  0,  0, -1,  1,  0,  0] ]
                 , "max_height": 5 }
+    if path.exists(CACHE_FILE):
+        cache.load(CACHE_FILE)
     my_agent.play(percepts=percepts, player=PLAYER1, step=1, time_left=900)
     try:
         agent_main(my_agent)
     except Exception as error:
         print(error)
-        print("Error in agent_main")
\ No newline at end of file
+        print("Error in agent_main")
+    makedirs(path.dirname(CACHE_FILE), exist_ok=True)
+    cache.save(CACHE_FILE)
@@ -1,11 +1,11 @@
 from numpy import inf, array, int64, absolute
 from numba import njit
-from njitavalam import Board as AvalamState, RED
+from njitavalam import Board as AvalamState, RED, decode_action
 from graveyard.heuristics import heuristic_2
-from joblib import Memory
+from position_cache import PositionCache
+
+cache = PositionCache()
 
-memory = Memory("cachedir", verbose=1, bytes_limit=1e9)
-@memory.cache
 def alpha_beta_pruning_search(percepts:dict, player:int, cutoff_depth:int, step: int):
     """
     Alpha-Beta Pruning search
@@ -31,22 +31,29 @@ def max_value(state:AvalamState, player:int, alpha:int, beta:int, depth:int, cut
     Max value function for alpha beta pruning yellow percpective
     """
     if state.is_finished():
-        return state.get_score(), None
+        return state.get_score(), -1
     if depth > cutoff_depth and is_quiescent(player, state):
-        return heuristic(state, player, step), None
+        return heuristic(state, player, step), -1
+    remaining_depth = cutoff_depth - depth
+    cached = cache.probe(state.key, player, remaining_depth, alpha, beta)
+    if cached is not None:
+        return cached
+    original_alpha, original_beta = alpha, beta
     depth += 1
     best_score = -inf
-    best_move = None
+    best_move = -1
 
-    for action in state.get_actions():
-        new_state = state.clone().play_action(action)
-        score, _ = min_value(new_state, player, alpha, beta, depth, cutoff_depth, step + 1)
+    for code in state.get_action_codes():
+        token = state.play_code_undoable(code)
+        score, _ = min_value(state, player, alpha, beta, depth, cutoff_depth, step + 1)
+        state.undo(token)
         if score > best_score:
             best_score = score
-            best_move = action
+            best_move = code
             alpha = max(alpha, best_score)
         if best_score >= beta:
-            return best_score, best_move
+            break
+    cache.store(state.key, player, remaining_depth, best_score, original_alpha, original_beta, best_move)
     return best_score, best_move
 
 def min_value(state:AvalamState, player:int, alpha:int, beta:int, depth:int, cutoff_depth:int, step:int):
@@ -54,22 +61,29 @@ def min_value(state:AvalamState, player:int, alpha:int, beta:int, depth:int, cut
     Min value function for alpha beta pruning red percepctive
     """
     if state.is_finished():
-        return state.get_score(), None
+        return state.get_score(), -1
     if depth > cutoff_depth and is_quiescent(player, state):
-        return heuristic(state, player, step), None
+        return heuristic(state, player, step), -1
+    remaining_depth = cutoff_depth - depth
+    cached = cache.probe(state.key, player, remaining_depth, alpha, beta)
+    if cached is not None:
+        return cached
+    original_alpha, original_beta = alpha, beta
     depth += 1
     best_score = inf
-    best_move = None
+    best_move = -1
 
-    for action in state.get_actions():
-        new_state = state.clone().play_action(action)
-        score, _ = max_value(new_state, player, alpha, beta, depth, cutoff_depth, step + 1)
+    for code in state.get_action_codes():
+        token = state.play_code_undoable(code)
+        score, _ = max_value(state, player, alpha, beta, depth, cutoff_depth, step + 1)
+        state.undo(token)
         if score < best_score:
             best_score = score
-            best_move = action
+            best_move = code
             beta = min(beta, best_score)
         if best_score <= alpha:
-            return best_score, best_move
+            break
+    cache.store(state.key, player, remaining_depth, best_score, original_alpha, original_beta, best_move)
     return best_score, best_move
 
 def alpha_beta_pruning_algo(state:AvalamState, player:int, cutoff_depth:int, step:int):
@@ -81,8 +95,10 @@ def alpha_beta_pruning_algo(state:AvalamState, player:int, cutoff_depth:int, ste
     :return: the best move
     """
     if player == RED:
-        return min_value(state, player, -inf, inf, 0, cutoff_depth, step)[1]
-    return max_value(state, player, -inf, inf, 0, cutoff_depth, step)[1]
+        code = min_value(state, player, -inf, inf, 0, cutoff_depth, step)[1]
+    else:
+        code = max_value(state, player, -inf, inf, 0, cutoff_depth, step)[1]
+    return decode_action(code) if code >= 0 else None
 
 def is_quiescent(player: int, state: AvalamState) -> bool:
     """
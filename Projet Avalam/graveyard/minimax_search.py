@@ -2,16 +2,24 @@
 Minimax with alpha beta pruning.
 Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
 Polytechnique Montréal
+
+Beyond the cutoff depth, a quiescence search only plays the tactical moves
+(completing a tower of maximum height or isolating a tower), so the heuristic
+is not applied in the middle of an exchange. It stops when no tactical move is
+left or after MAX_QUIESCENCE_DEPTH moves, so it can still evaluate a position
+with tactical moves pending.
 """
 
-from numpy import inf, array, int64, absolute
+from numpy import inf, array, int64, empty, zeros
 from numba import njit
-from njitavalam import Board as AvalamState, RED
+from njitavalam import Board as AvalamState, RED, N_CELLS, NEIGHBOURS, BIT_COUNTS, decode_action
 from graveyard.heuristics import basic_heuristic, heuristic_1, heuristic_2, heuristic_isolation
-from joblib import Memory
+from position_cache import PositionCache
+
+cache = PositionCache()
+# maximum number of tactical moves played by the quiescence search
+MAX_QUIESCENCE_DEPTH = 2
 
-memory = Memory("cachedir", verbose=1, bytes_limit=1e9)
-@memory.cache
 def alpha_beta_pruning_search(percepts:dict, player:int, cutoff_depth:int, step: int):
     """
     Alpha-Beta Pruning search
@@ -37,22 +45,29 @@ def max_value(state:AvalamState, player:int, alpha:int, beta:int, depth:int, cut
     Max value function for alpha beta pruning yellow percpective
     """
     if state.is_finished():
-        return state.get_score(), None
-    if depth > cutoff_depth and is_quiescent(player, state):
-        return heuristic(state, player, step), None
+        return state.get_score(), -1
+    if depth > cutoff_depth:
+        return quiescence_max(state, player, alpha, beta, 0, step), -1
+    remaining_depth = cutoff_depth - depth
+    cached = cache.probe(state.key, player, remaining_depth, alpha, beta)
+    if cached is not None:
+        return cached
+    original_alpha, original_beta = alpha, beta
     depth += 1
     best_score = -inf
-    best_move = None
+    best_move = -1
 
-    for action in state.get_actions():
-        new_state = state.clone().play_action(action)
-        score, _ = min_value(new_state, player, alpha, beta, depth, cutoff_depth, step + 1)
+    for code in state.get_action_codes():
+        token = state.play_code_undoable(code)
+        score, _ = min_value(state, player, alpha, beta, depth, cutoff_depth, step + 1)
+        state.undo(token)
         if score > best_score:
             best_score = score
-            best_move = action
+            best_move = code
             alpha = max(alpha, best_score)
         if best_score >= beta:
-            return best_score, best_move
+            break
+    cache.store(state.key, player, remaining_depth, best_score, original_alpha, original_beta, best_move)
     return best_score, best_move
 
 def min_value(state:AvalamState, player:int, alpha:int, beta:int, depth:int, cutoff_depth:int, step:int):
@@ -60,22 +75,29 @@ def min_value(state:AvalamState, player:int, alpha:int, beta:int, depth:int, cut
     Min value function for alpha beta pruning red percepctive
     """
     if state.is_finished():
-        return state.get_score(), None
-    if depth > cutoff_depth and is_quiescent(player, state):
-        return heuristic(state, player, step), None
+        return state.get_score(), -1
+    if depth > cutoff_depth:
+        return quiescence_min(state, player, alpha, beta, 0, step), -1
+    remaining_depth = cutoff_depth - depth
+    cached = cache.probe(state.key, player, remaining_depth, alpha, beta)
+    if cached is not None:
+        return cached
+    original_alpha, original_beta = alpha, beta
     depth += 1
     best_score = inf
-    best_move = None
+    best_move = -1
 
-    for action in state.get_actions():
-        new_state = state.clone().play_action(action)
-        score, _ = max_value(new_state, player, alpha, beta, depth, cutoff_depth, step + 1)
+    for code in state.get_action_codes():
+        token = state.play_code_undoable(code)
+        score, _ = max_value(state, player, alpha, beta, depth, cutoff_depth, step + 1)
+        state.undo(token)
         if score < best_score:
             best_score = score
-            best_move = action
+            best_move = code
             beta = min(beta, best_score)
         if best_score <= alpha:
-            return best_score, best_move
+            break
+    cache.store(state.key, player, remaining_depth, best_score, original_alpha, original_beta, best_move)
     return best_score, best_move
 
 def alpha_beta_pruning_algo(state:AvalamState, player:int, cutoff_depth:int, step:int):
@@ -87,46 +109,135 @@ def alpha_beta_pruning_algo(state:AvalamState, player:int, cutoff_depth:int, ste
     :return: the best move
     """
     if player == RED:
-        return min_value(state, player, -inf, inf, 0, cutoff_depth, step)[1]
-    return max_value(state, player, -inf, inf, 0, cutoff_depth, step)[1]
+        code = min_value(state, player, -inf, inf, 0, cutoff_depth, step)[1]
+    else:
+        code = max_value(state, player, -inf, inf, 0, cutoff_depth, step)[1]
+    return decode_action(code) if code >= 0 else None
 
-def is_quiescent(player: int, state: AvalamState) -> bool:
+def quiescence_max(state:AvalamState, player:int, alpha:float, beta:float, quiescence_depth:int, step:int):
+    """
+    Max value function of the quiescence search yellow perspective
+    The heuristic value is a lower bound, yellow can also play a tactical move
+    """
+    if state.is_finished():
+        return state.get_score()
+    best_score = heuristic(state, player, step)
+    if best_score >= beta or quiescence_depth >= MAX_QUIESCENCE_DEPTH:
+        return best_score
+    alpha = max(alpha, best_score)
+    for code in tactical_action_codes(state):
+        token = state.play_code_undoable(code)
+        score = quiescence_min(state, player, alpha, beta, quiescence_depth + 1, step + 1)
+        state.undo(token)
+        if score > best_score:
+            best_score = score
+            alpha = max(alpha, best_score)
+        if best_score >= beta:
+            break
+    return best_score
+
+def quiescence_min(state:AvalamState, player:int, alpha:float, beta:float, quiescence_depth:int, step:int):
+    """
+    Min value function of the quiescence search red perspective
+    The heuristic value is an upper bound, red can also play a tactical move
     """
-    Check if the state is quiescent
+    if state.is_finished():
+        return state.get_score()
+    best_score = heuristic(state, player, step)
+    if best_score <= alpha or quiescence_depth >= MAX_QUIESCENCE_DEPTH:
+        return best_score
+    beta = min(beta, best_score)
+    for code in tactical_action_codes(state):
+        token = state.play_code_undoable(code)
+        score = quiescence_max(state, player, alpha, beta, quiescence_depth + 1, step + 1)
+        state.undo(token)
+        if score < best_score:
+            best_score = score
+            beta = min(beta, best_score)
+        if best_score <= alpha:
+            break
+    return best_score
+
+@njit()
+def isolating_action_masks(state:AvalamState):
     """
-    return len(state.get_actions()) > 10
+    Returns, for each cell, the mask of the moves of its tower that leave a
+    neighbouring tower without valid move. Only the towers with one or two
+    valid moves can lose all of them in a single move.
     """
-    x_from, y_from, i, j = state.last_action
-    h = state.m[i][j]
-    h_abs = absolute(h)
-    max_height = state.max_height
+    masks = zeros(N_CELLS, dtype=int64)
+    for cell in range(N_CELLS):
+        mask = state.tower_actions[cell]
+        if mask == 0 or BIT_COUNTS[mask] > 2:
+            continue
+        limit = state.max_height - abs(state.cells[cell])
+        first = -1
+        for direction in range(8):
+            if mask & (1 << direction):
+                partner = NEIGHBOURS[cell, direction]
+                if first < 0:
+                    first = partner
+                else:
+                    # both partners are lost if one is stacked on the other and gets too high
+                    for other, target in ((first, partner), (partner, first)):
+                        for move in range(8):
+                            if NEIGHBOURS[other, move] == target and state.tower_actions[other] & (1 << move) and \
+                                    abs(state.cells[other]) + abs(state.cells[target]) > limit:
+                                masks[other] |= 1 << move
+        if BIT_COUNTS[mask] == 1:
+            partner_height = abs(state.cells[first])
+            for direction in range(8):
+                neighbour = NEIGHBOURS[first, direction]
+                if neighbour < 0:
+                    continue
+                # direction 7 - d is the opposite of direction d
+                if neighbour == cell:
+                    # the partner moves anywhere but on the tower
+                    masks[first] |= state.tower_actions[first] & ~(1 << direction)
+                elif state.tower_actions[neighbour] & (1 << (7 - direction)) and \
+                        abs(state.cells[neighbour]) + partner_height > limit:
+                    # a tower stacked on the partner makes it too high
+                    masks[neighbour] |= 1 << (7 - direction)
+    return masks
 
-    # if the last action can be capture for a tower of height 5 then it is not quiescent
-    # code smells but it is for performance reasons
-    if h_abs != max_height and h_abs != 2:
-        if i != 0 and j !=0:
-            if absolute(state.m[i-1, j-1]) + h_abs == max_height and state.m[i-1, j-1] + h != max_height:
-                return False
-        if i != 0:
-            if absolute(state.m[i-1, j]) + h_abs == max_height and state.m[i-1, j] + h != max_height:
-                return False
-        if i != 0 and j != 8:
-            if absolute(state.m[i-1, j+1]) + h_abs == max_height and state.m[i-1, j+1] + h != max_height:
-                return False
-        if j != 0:
-            if absolute(state.m[i, j-1]) + h_abs == max_height and state.m[i, j-1] + h != max_height:
-                return False
-        if j != 8:
-            if absolute(state.m[i, j+1]) + h_abs == max_height and state.m[i, j+1] + h != max_height:
-                return False
-        if i != 8 and j != 0:
-            if absolute(state.m[i+1, j-1]) + h_abs == max_height and state.m[i+1, j-1] + h != max_height:
-                return False
-        if i != 8:
-            if absolute(state.m[i+1, j]) + h_abs == max_height and state.m[i+1, j] + h != max_height:
-                return False
-        if i != 8 and j != 8:
-            if absolute(state.m[i+1, j+1]) + h_abs == max_height and state.m[i+1, j+1] + h != max_height:
-                return False
-    return True
-    """
\ No newline at end of file
+@njit()
+def tactical_action_codes(state:AvalamState):
+    """
+    Returns the codes of the tactical actions of the state
+    (in the order of state.get_action_codes): the moves completing a tower of
+    maximum height or leaving a tower (the new one or a neighbour) without
+    valid move
+    """
+    isolating = isolating_action_masks(state)
+    codes = empty(state.n_actions, dtype=int64)
+    n_codes = 0
+    for source in range(N_CELLS):
+        mask = state.tower_actions[source]
+        if mask == 0:
+            continue
+        source_height = abs(state.cells[source])
+        for direction in range(8):
+            if not mask & (1 << direction):
+                continue
+            target = NEIGHBOURS[source, direction]
+            limit = state.max_height - source_height - abs(state.cells[target])
+            tactical = limit == 0 or isolating[source] & (1 << direction)
+            if not tactical:
+                # the new tower can only keep the moves of the target
+                tactical = True
+                target_mask = state.tower_actions[target]
+                for move in range(8):
+                    neighbour = NEIGHBOURS[target, move]
+                    if target_mask & (1 << move) and neighbour != source and abs(state.cells[neighbour]) <= limit:
+                        tactical = False
+                        break
+            if tactical:
+                codes[n_codes] = source * 8 + direction
+                n_codes += 1
+    return codes[:n_codes]
+
+def is_quiescent(player: int, state: AvalamState) -> bool:
+    """
+    Check if the state is quiescent (no tactical move)
+    """
+    return len(tactical_action_codes(state)) == 0
@@ -45,17 +45,17 @@ def quick_action(state:AvalamState, player:int):
     for action in actions:
         x_from, y_from, x_to, y_to = action
         # Rule 1: si il est possible de faire une tour de 5
-        if (state.m[x_from][y_from] == player and
-            np_absolute(state.m[x_from][y_from] + state.m[x_to][y_to]) == state.max_height):
+        if (state.get_cell(x_from, y_from) == player and
+            np_absolute(state.get_cell(x_from, y_from) + state.get_cell(x_to, y_to)) == state.max_height):
             return action
 
         # Rule 2: Isoler une tour de notre couleur
-        if state.m[x_from][y_from] == player and is_tower_isolated(state, action):
+        if state.get_cell(x_from, y_from) == player and is_tower_isolated(state, action):
             actions_statisfy_rule2.append(action)
 
         # Rule 3: Bouger le pion de la couleur adverse sur un autre pion adverse si c'est le debut de partie
         if ( len(actions) < 254 and
-            state.m[x_from][y_from] * player == 1 and state.m[x_to][y_to] * player == 1 ):
+            state.get_cell(x_from, y_from) * player == 1 and state.get_cell(x_to, y_to) * player == 1 ):
             actions_statisfy_rule3.append(action)
 
     if len(actions_statisfy_rule2) > 0:
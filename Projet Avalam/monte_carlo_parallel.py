@@ -0,0 +1,87 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Recherche d'arbre de Monte Carlo parallèle à la racine.
+Chaque processus fait une recherche indépendante sur la même position avec une
+graine différente, puis les statistiques des enfants de la racine sont
+additionnées pour choisir l'action. Chaque processus s'arrête dès que la
+décision à sa racine est réglée (monte_carlo_tree_search.settled_condition), le
+temps économisé reste dans le crédit de l'agent.
+"""
+
+from multiprocessing import Pool
+from random import seed as python_seed
+from numba import njit
+from numpy import array, int64, random as np_random
+from njitavalam import Board
+from monte_carlo_tree_node import MCTS_Node as Node
+from monte_carlo_tree_pool import (NodePool, pool_capacity, monte_carlo_pool_algo, root_statistics,
+                                   children_visits)
+from monte_carlo_tree_search import time_condition, settled_condition, new_root, monte_carlo_algo
+from transposition_table import TranspositionTable
+from time_manager import TimeManager
+
+# time kept to send the position to the workers and merge their statistics
+COMMUNICATION_TIME = 0.5
+
+@njit()
+def seed_numba(seed:int):
+    """
+    Seed the random generator of the compiled functions
+    """
+    np_random.seed(seed)
+
+def search_worker(percepts, max_height:int, player:int, step:int, time_left:float, seed:int,
+                  bitboard:bool, array_tree:bool):
+    """
+    Run a monte carlo tree search in a worker, until time_left or until the
+    decision at the root is settled
+    Returns {action code: (n_simulations, utility)} for the children of the root
+    """
+    python_seed(seed)
+    seed_numba(seed)
+    board = Board(array(percepts, dtype=int64), max_height)
+    if array_tree:
+        pool = NodePool(pool_capacity(time_left))
+        stop_condition = settled_condition(lambda: children_visits(pool), time_condition)
+        monte_carlo_pool_algo(board, player, stop_condition, time_left, pool=pool)
+        return {action: (n_simulations, utility) for action, n_simulations, utility in root_statistics(pool)}
+
+    root:Node = new_root(board, player, bitboard)
+    stop_condition = settled_condition(lambda: [child.n_simulations for child in root.children], time_condition)
+    monte_carlo_algo(root, player, stop_condition, step, time_left, TranspositionTable())
+    return {action: (child.n_simulations, child.utility)
+            for action, child in zip(root.actions, root.children)}
+
+def merge_statistics(statistics:list[dict]):
+    """
+    Returns the sum of the statistics of each action
+    """
+    merged = {}
+    for worker_statistics in statistics:
+        for action, (n_simulations, utility) in worker_statistics.items():
+            total_simulations, total_utility = merged.get(action, (0, 0))
+            merged[action] = (total_simulations + n_simulations, total_utility + utility)
+    return merged
+
+def root_parallel_search(workers:Pool, n_workers:int, board:Board, player:int, step:int, time_left:int,
+                         bitboard:bool=False, array_tree:bool=False, seed:int=0,
+                         time_manager:TimeManager=None):
+    """
+    Returns the code of the most simulated action over n_workers independent searches
+    The workers search during the budget of time_manager, or until their decision is settled
+    """
+    if board.n_actions == 1:
+        return board.get_nth_action_code(0)
+    if time_manager is None:
+        time_manager = TimeManager()
+    # time_condition stops one second before time_left
+    time_left = max(1.0, time_manager.turn_budget(time_left, board.n_actions) + 1 - COMMUNICATION_TIME)
+    percepts = board.get_percepts().tolist()
+    arguments = [(percepts, board.max_height, player, step, time_left, seed + worker, bitboard, array_tree)
+                 for worker in range(n_workers)]
+    merged = merge_statistics(workers.starmap(search_worker, arguments))
+    if len(merged) == 0:
+        return None
+    return max(merged, key=lambda action: merged[action][0])
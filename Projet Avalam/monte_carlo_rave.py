@@ -0,0 +1,39 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Statistiques RAVE (All Moves As First) de la recherche d'arbre de Monte Carlo.
+Chaque noeud développé garde, pour chaque code d'action
+(njitavalam.encode_action), le nombre de simulations où le joueur du noeud a
+joué cette action plus loin dans la partie et la somme de leurs scores. Une
+action ne peut être jouée qu'une fois dans une partie (la case de départ reste
+vide), il n'y a donc pas à vérifier si elle a déjà été vue.
+
+Gelly et Silver, Monte-Carlo tree search and rapid action value estimation
+in computer Go (2011)
+"""
+
+from numba import njit
+from njitavalam import N_CELLS
+
+# bias b of the AMAF estimate in the weight of the RAVE statistics
+DEFAULT_RAVE_BIAS = 0.1
+# maximum number of moves in a game (each move removes a tower)
+MAX_MOVES = N_CELLS
+
+@njit(nogil=True)
+def update_amaf(amaf_n, amaf_utility, codes, start:int, stop:int, utility:float):
+    """
+    Add the simulation to the statistics of the actions codes[start],
+    codes[start + 2], ... played by the same player before stop
+    """
+    for index in range(start, stop, 2):
+        amaf_n[codes[index]] += 1
+        amaf_utility[codes[index]] += utility
+
+def rave_weight(n_simulations:int, amaf_n:int, bias:float):
+    """
+    Returns the weight of the AMAF mean in the value of an action
+    (the weight minimizing the mean squared error of the MC-RAVE paper)
+    """
+    return amaf_n / (n_simulations + amaf_n + 4 * bias**2 * n_simulations * amaf_n)
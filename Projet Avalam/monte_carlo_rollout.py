@@ -0,0 +1,110 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Simulations (rollouts) de la recherche d'arbre de Monte Carlo compilées avec
+numba. Plusieurs parties sont jouées jusqu'à la fin dans un seul appel pour
+ne pas repasser par Python à chaque coup.
+
+vectorized_rollouts joue plutôt B parties en même temps sur un tableau
+(B,48) d'int8 avec le même encodage que njitavalam.Board.cells, les actions
+valides sont calculées en lisant le voisin de chaque case dans chacune des 8
+directions (njitavalam.NEIGHBOURS).
+"""
+
+from numba import njit
+import numpy as np
+from njitavalam import DIRECTIONS, NEIGHBOURS, N_CELLS
+
+@njit(nogil=True)
+def random_rollout(board):
+    """
+    Play random actions on the board until the end and returns its score
+    The board is modified
+    """
+    while not board.is_finished():
+        board.play_code(board.get_nth_action_code(np.random.randint(board.n_actions)))
+    return board.get_score()
+
+@njit(nogil=True)
+def random_rollouts(board, n_rollouts:int):
+    """
+    Returns the scores of n_rollouts random playouts from the board
+    The board is not modified
+    """
+    scores = np.empty(n_rollouts, dtype=np.int64)
+    for rollout in range(n_rollouts):
+        scores[rollout] = random_rollout(board.clone())
+    return scores
+
+@njit(nogil=True)
+def random_rollout_codes(board, codes, start:int):
+    """
+    Play random actions on the board until the end and returns its score and
+    the index after the last move. The codes of the actions are written in
+    codes from start. The board is modified
+    """
+    n_moves = start
+    while not board.is_finished():
+        code = board.get_nth_action_code(np.random.randint(board.n_actions))
+        codes[n_moves] = code
+        n_moves += 1
+        board.play_code(code)
+    return board.get_score(), n_moves
+
+def legal_moves(boards, max_height:int=5):
+    """
+    Returns the mask of the valid moves of a (B,48) array of boards as a
+    (B,8,48) array, legal[b, d, cell] is True if the tower on cell of board b
+    can move in direction DIRECTIONS[d]
+    """
+    heights = np.abs(boards)
+    # NEIGHBOURS is -1 outside of the board, which reads the empty last column
+    padded = np.concatenate((heights, np.zeros((len(boards), 1), dtype=heights.dtype)), axis=1)
+    legal = np.empty((len(boards), len(DIRECTIONS), N_CELLS), dtype=bool)
+    for direction in range(len(DIRECTIONS)):
+        target = padded[:, NEIGHBOURS[:, direction]]
+        legal[:, direction] = (heights > 0) & (target > 0) & (heights + target <= max_height)
+    return legal
+
+def get_scores(boards, max_height:int=5):
+    """
+    Returns the score of each board of a (B,48) array (see njitavalam.Board.get_score)
+    """
+    scores = (boards > 0).sum(axis=1) - (boards < 0).sum(axis=1)
+    ties = scores == 0
+    scores[ties] = (boards[ties] == max_height).sum(axis=1) - (boards[ties] == -max_height).sum(axis=1)
+    return scores
+
+def vectorized_rollouts(boards, max_height:int=5, rng=None):
+    """
+    Play random actions on all the boards of a (B,48) array at the same time
+    until every game is finished and returns their scores. The boards are modified.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    while True:
+        legal = legal_moves(boards, max_height).reshape(len(boards), -1)
+        n_actions = legal.sum(axis=1)
+        playing = np.flatnonzero(n_actions)
+        if len(playing) == 0:
+            return get_scores(boards, max_height)
+
+        # choose a random valid move on each board still playing
+        chosen = (rng.random(len(playing)) * n_actions[playing]).astype(np.int64)
+        move = np.argmax(np.cumsum(legal[playing], axis=1) > chosen[:, None], axis=1)
+        direction, source = move // N_CELLS, move % N_CELLS
+        target = NEIGHBOURS[source, direction]
+
+        height = np.abs(boards[playing, source]) + np.abs(boards[playing, target])
+        boards[playing, target] = np.where(boards[playing, source] < 0, -height, height)
+        boards[playing, source] = 0
+
+def states_rollouts(states, n_rollouts:int=1, rng=None):
+    """
+    Returns the scores of n_rollouts random playouts of each state as a
+    (len(states), n_rollouts) array, all the games are played together
+    """
+    boards = np.repeat(np.stack([state.get_cells() for state in states]), n_rollouts, axis=0)
+    scores = vectorized_rollouts(boards, states[0].max_height, rng)
+    return scores.reshape(len(states), n_rollouts)
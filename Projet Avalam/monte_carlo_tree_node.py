@@ -10,51 +10,88 @@ https://www.geeksforgeeks.org/left-child-right-sibling-representation-tree/
 https://en.wikipedia.org/wiki/Left-child_right-sibling_binary_tree
 """
 
-from random import choice
-from numpy import sqrt, inf, log
-from avalam import Board
-from njitavalam import YELLOW, RED, Board as AvalamState
+from random import randrange
+from numpy import sqrt, inf, log, zeros, int64, float64
+from njitavalam import YELLOW, RED, Board as AvalamState, N_ACTION_CODES
+from monte_carlo_rollout import random_rollout, random_rollouts, random_rollout_codes
+from monte_carlo_rave import rave_weight
+from transposition_table import TranspositionTable
+from endgame_solver import solve, LEAF_THRESHOLD
 
 class MCTS_Node: # pylint: disable=invalid-name
     """
     Noeud de monte carlo tree search
+    Les actions sont des codes (njitavalam.encode_action).
+    Un noeud peut avoir plusieurs parents lorsqu'une table de transposition
+    est utilisée (l'arbre devient un graphe acyclique dirigé), l'action menant
+    à chaque enfant est donc conservée par le parent.
+    proven est le score exact du noeud (endgame_solver) lorsqu'il reste peu
+    d'actions, il remplace alors les simulations.
+    Les enfants ne gardent que l'action qui y mène depuis parent, leur prior et
+    la clé de leur position, le plateau n'est créé que lorsqu'il est utilisé
+    pour la première fois (voir state).
+    amaf_n et amaf_utility sont les statistiques RAVE du noeud indexées par le
+    code des actions (voir monte_carlo_rave). Ils ne sont alloués qu'avec
+    allocate_amaf.
     """
-    def __init__(self, state: AvalamState, parent, player:int):
-        self.state = state
+    __slots__ = ("_state", "parent", "action", "prior", "key", "children", "actions", "utility",
+                 "n_simulations", "player", "proven", "amaf_n", "amaf_utility")
+
+    def __init__(self, state: AvalamState, parent, player:int, action=None, prior:float=0.0, key:int=None):
+        self._state = state
         self.parent = parent
-        self.child = None
-        self.next = None
+        self.action = action
+        self.prior = prior
+        self.key = state.key if key is None else key
+        self.children = []
+        self.actions = []
         self.utility = 0
         self.n_simulations = 0
         self.player = player
+        self.proven = None
+        self.amaf_n = None
+        self.amaf_utility = None
 
     @property
-    def children(self):
+    def state(self):
         """
-        Returns a list of all children of this node
+        Returns the board of the node, played from the board of the parent
+        the first time it is needed
         """
-        children = []
-        child = self.child
-        while child is not None:
-            children.append(child)
-            child = child.next
-        return children
+        if self._state is None:
+            self._state = self.parent.state.clone().play_code(self.action)
+        return self._state
 
-    def expand(self):
+    def expand(self, table: TranspositionTable = None, prior=None):
         """
         expand the node by adding all possible children
-        """
-        if self.child is None:
-            actions = self.state.get_actions()
-            if len(actions) > 0:
-                next_state = self.state.clone().play_action(actions[0])
-                sibling = MCTS_Node(next_state, self, self.player * -1)
-                self.child = sibling
-                for action in actions[1:]:
-                    next_state = self.state.clone().play_action(action)
-                    sibling.next = MCTS_Node(next_state, self, self.player * -1)
-                    sibling = sibling.next
-                return self.child
+        children already in the transposition table are shared
+        prior(state, action, player) is the prior of the child reached by the
+        action, the children are then sorted by decreasing prior
+        """
+        if self.is_leaf:
+            state = self.state
+            priors = []
+            for action in state.get_action_codes():
+                child_prior = 0.0 if prior is None else prior(state, action, self.player)
+                # the key of the child is read on the state itself
+                token = state.play_code_undoable(action)
+                key = state.key
+                state.undo(token)
+                child = None if table is None else table.get(key)
+                if child is None:
+                    child = MCTS_Node(None, self, self.player * -1, action, child_prior, key)
+                    if table is not None:
+                        table.store(key, child)
+                self.children.append(child)
+                self.actions.append(action)
+                priors.append(child_prior)
+            if prior is not None:
+                order = sorted(range(len(priors)), key=lambda index: -priors[index])
+                self.children = [self.children[index] for index in order]
+                self.actions = [self.actions[index] for index in order]
+            if len(self.children) > 0:
+                return self.children[0]
         return self
 
     @property
@@ -62,7 +99,7 @@ class MCTS_Node: # pylint: disable=invalid-name
         """
         Returns True if the node is a leaf
         """
-        return self.child is None
+        return len(self.children) == 0
 
     @property
     def is_root(self):
@@ -71,72 +108,108 @@ class MCTS_Node: # pylint: disable=invalid-name
         """
         return self.parent is None
 
-    def UCT(self, player: RED|YELLOW): # pylint: disable=invalid-name
+    def UCT(self, player: RED|YELLOW, parent_n_simulations: int): # pylint: disable=invalid-name
         """
         Returns the UCT value of the node
         On multiplie par le player pour que si on est les rouges ont
         cherche la plus grande moyene (<0: red, >0: yellow, 0: draw)
         (negative for red, positive for yellow)
+        parent_n_simulations est le nombre de simulations du parent par lequel
+        on arrive au noeud
         """
-        if self.n_simulations == 0 or self.is_root:
+        if self.n_simulations == 0:
             return inf
         return ( (self.utility * player) / self.n_simulations +
-                sqrt(2) * sqrt(2 * log(self.parent.n_simulations) / self.n_simulations))
+                sqrt(2) * sqrt(2 * log(parent_n_simulations) / self.n_simulations))
 
-    def backpropagate(self, utility):
+    def RAVE(self, player: RED|YELLOW, parent_n_simulations: int, amaf_n: int, amaf_utility: float, # pylint: disable=invalid-name
+             bias: float):
         """
-        backpropagate the utility of the simulation
+        Returns the UCT value of the node where the mean is blended with the
+        AMAF mean of the action leading to the node, amaf_n and amaf_utility
+        are the statistics of the action in the parent
         """
-        self.increment(utility)
+        if amaf_n == 0:
+            return self.UCT(player, parent_n_simulations)
+        weight = rave_weight(self.n_simulations, amaf_n, bias)
+        mean = amaf_utility / amaf_n
+        if self.n_simulations > 0:
+            mean = weight * mean + (1 - weight) * self.utility / self.n_simulations
+        return ( mean * player +
+                sqrt(2) * sqrt(2 * log(max(1, parent_n_simulations)) / max(1, self.n_simulations)))
 
-        if self.parent is not None:
-            current_node = self.parent
-            while current_node is not None:
-                current_node.increment(utility)
-                current_node = current_node.parent
+    def allocate_amaf(self):
+        """
+        Allocate the RAVE statistics of the node once it is expanded
+        """
+        if self.amaf_n is None:
+            self.amaf_n = zeros(N_ACTION_CODES, dtype=int64)
+            self.amaf_utility = zeros(N_ACTION_CODES, dtype=float64)
 
-    def increment(self, utility):
+    def increment(self, utility, n_simulations:int=1):
         """
         Increment the number of simulations of the node
+        utility is the sum of the scores of the n_simulations simulations
         """
-        self.n_simulations += 1
+        self.n_simulations += n_simulations
         self.utility += utility
 
+    def get_child(self, action):
+        """
+        Returns the child reached by the action or None
+        """
+        for child_action, child in zip(self.actions, self.children):
+            if child_action == action:
+                return child
+        return None
+
     def best_child(self):
         """
-        Returns the best child
+        Returns the action and the best child
         """
-        if self.child is None:
-            return None
+        if self.is_leaf:
+            return None, None
 
-        best_child_found = self.child
-        max_n_simulations = best_child_found.n_simulations
-        for child in self.children:
+        best_index = 0
+        max_n_simulations = self.children[0].n_simulations
+        for index, child in enumerate(self.children):
             if child.n_simulations > max_n_simulations:
-                best_child_found = child
+                best_index = index
                 max_n_simulations = child.n_simulations
 
-        return best_child_found
+        return self.actions[best_index], self.children[best_index]
 
     def rollout_policy(self, state:AvalamState):
         """
         policy used for the rollout
         """
-        return choice(state.get_actions())
+        return state.get_nth_action_code(randrange(state.n_actions))
+
+    def rollout(self, step:int, n_rollouts:int=1): # pylint: disable=unused-argument
+        """
+        Simulate n_rollouts random playouts from this node in compiled code
+        Returns the sum of their scores
+        The exact score is used instead if the node has at most LEAF_THRESHOLD actions
+        """
+        if self.proven is None and self.state.n_actions <= LEAF_THRESHOLD:
+            self.proven, _ = solve(self.state, self.player)
+        if self.proven is not None:
+            return self.proven * n_rollouts
+        if n_rollouts == 1:
+            return random_rollout(self.state.clone())
+        return int(random_rollouts(self.state, n_rollouts).sum())
 
-    def rollout(self, step:int):
+    def rollout_amaf(self, codes, start:int):
         """
-        Simulate a playout from this node
+        Simulate a random playout from this node, the codes of its actions
+        are written in codes from start (see random_rollout_codes)
+        Returns its score and the index after the last action
         """
-        current_rollout_state: Board = self.state.clone()
-        current_player = self.player
-        current_step = step
-        while not current_rollout_state.is_finished():
-            action = self.rollout_policy(current_rollout_state)
-            current_rollout_state = current_rollout_state.play_action(action)
-            current_player = current_player * -1
-            current_step += 1
-        return current_rollout_state.get_score()
+        if self.proven is None and self.state.n_actions <= LEAF_THRESHOLD:
+            self.proven, _ = solve(self.state, self.player)
+        if self.proven is not None:
+            return self.proven, start
+        return random_rollout_codes(self.state.clone(), codes, start)
 
 if __name__ == "__main__":
     state1 = AvalamState()
@@ -0,0 +1,340 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Recherche d'arbre de Monte Carlo sur un arbre stocké dans des tableaux NumPy
+préalloués (une colonne par attribut des noeuds). La sélection, l'expansion, la
+simulation et la rétropropagation sont compilées avec numba, il n'y a donc
+aucun objet Python créé pendant la recherche.
+
+Les enfants d'un noeud sont créés un à la fois, un par visite, dans l'ordre de
+get_action_codes (n_children[i] est le curseur sur les actions non essayées).
+Chaque itération alloue donc au plus un noeud. Seuls les enfants de la racine
+sont tous créés dès le départ pour que les statistiques de la racine (gestion
+du temps) couvrent toutes les actions.
+
+Les fonctions compilées relâchent le GIL, plusieurs fils d'exécution peuvent
+donc parcourir le même arbre (parallélisme d'arbre avec perte virtuelle).
+Chaque fil alloue ses noeuds dans sa propre région du NodePool et un noeud
+n'est relié à son parent qu'une fois initialisé. Les mises à jour des
+statistiques ne sont pas atomiques, quelques simulations peuvent être perdues
+(ou un enfant créé deux fois) lorsque deux fils mettent à jour le même noeud au
+même moment.
+
+https://en.wikipedia.org/wiki/Left-child_right-sibling_binary_tree
+"""
+
+from time import time
+from threading import Thread
+from numba import njit
+from numba.experimental import jitclass
+from numba.types import int64, float64
+import numpy as np
+from monte_carlo_rollout import random_rollout
+
+ROOT = 0
+NO_NODE = -1
+DEFAULT_CAPACITY = 2**20
+MAX_CAPACITY = 2**23
+# simulations per second of a thread, used to size the pool from the time budget
+SIMULATIONS_PER_SECOND = 40000
+# number of iterations done in compiled code between two checks of the stop condition
+ITERATIONS_PER_BATCH = 64
+# utility removed from a node for each thread currently simulating below it
+DEFAULT_VIRTUAL_LOSS = 1.0
+
+@jitclass([
+    ('n_simulations', int64[:]),
+    ('utility', float64[:]),
+    ('first_child', int64[:]),
+    ('next_sibling', int64[:]),
+    ('parent', int64[:]),
+    ('action', int64[:]),
+    ('start', int64[:]),
+    ('cursor', int64[:]),
+    ('limit', int64[:]),
+    ('n_children', int64[:]),
+    ('overflows', int64),
+])
+class NodePool:
+    """
+    Noeuds de l'arbre de monte carlo sous forme de tableaux
+    Le noeud i a n_simulations[i] simulations, une utilité totale utility[i],
+    son premier enfant first_child[i], son frère suivant next_sibling[i], son
+    parent parent[i] et le code de l'action action[i] qui y mène
+    (njitavalam.encode_action). Le noeud 0 est la racine.
+    n_children[i] est le nombre d'enfants créés, ce sont les n_children[i]
+    premières actions de get_action_codes.
+    Le fil t alloue ses noeuds de start[t] à limit[t], cursor[t] est le
+    prochain noeud libre. overflows compte les noeuds qui n'ont pas pu être
+    alloués parce que la région du fil était pleine.
+    """
+    def __init__(self, capacity:int, n_threads:int=1):
+        # the nodes are initialized by allocate, the memory of the unused ones is never touched
+        self.n_simulations = np.empty(capacity, dtype=np.int64)
+        self.utility = np.empty(capacity, dtype=np.float64)
+        self.first_child = np.empty(capacity, dtype=np.int64)
+        self.next_sibling = np.empty(capacity, dtype=np.int64)
+        self.parent = np.empty(capacity, dtype=np.int64)
+        self.action = np.empty(capacity, dtype=np.int64)
+        self.n_children = np.empty(capacity, dtype=np.int64)
+        self.n_simulations[ROOT] = 0
+        self.utility[ROOT] = 0
+        self.first_child[ROOT] = NO_NODE
+        self.next_sibling[ROOT] = NO_NODE
+        self.parent[ROOT] = NO_NODE
+        self.action[ROOT] = 0
+        self.n_children[ROOT] = 0
+        self.overflows = 0
+        region = (capacity - 1) // n_threads
+        self.start = 1 + region * np.arange(n_threads)
+        self.cursor = self.start.copy()
+        self.limit = self.start + region
+
+    @property
+    def capacity(self):
+        """
+        Returns the maximum number of nodes
+        """
+        return len(self.n_simulations)
+
+    @property
+    def size(self):
+        """
+        Returns the number of nodes allocated
+        """
+        return 1 + np.sum(self.cursor - self.start)
+
+    def available(self, thread:int):
+        """
+        Returns the number of nodes the thread can still allocate
+        """
+        return self.limit[thread] - self.cursor[thread]
+
+    def allocate(self, parent:int, action:int, thread:int=0):
+        """
+        Returns the index of a new node or NO_NODE if the region of the thread is full
+        """
+        if self.cursor[thread] >= self.limit[thread]:
+            self.overflows += 1
+            return NO_NODE
+        node = self.cursor[thread]
+        self.cursor[thread] += 1
+        self.parent[node] = parent
+        self.action[node] = action
+        self.first_child[node] = NO_NODE
+        self.next_sibling[node] = NO_NODE
+        self.n_simulations[node] = 0
+        self.utility[node] = 0
+        self.n_children[node] = 0
+        return node
+
+def pool_capacity(time_budget:float, n_threads:int=1):
+    """
+    Returns the capacity of a pool for a search of time_budget seconds with
+    n_threads threads (one node per simulation)
+    """
+    capacity = int(SIMULATIONS_PER_SECOND * n_threads * time_budget) + 1
+    return min(MAX_CAPACITY, max(DEFAULT_CAPACITY, capacity))
+
+@njit(nogil=True)
+def uct(pool:NodePool, node:int, parent_n_simulations:int, player:int):
+    """
+    Returns the UCT value of the node (see MCTS_Node.UCT)
+    """
+    if pool.n_simulations[node] == 0:
+        return np.inf
+    return ( (pool.utility[node] * player) / pool.n_simulations[node] +
+            np.sqrt(2) * np.sqrt(2 * np.log(parent_n_simulations) / pool.n_simulations[node]))
+
+@njit(nogil=True)
+def tree_policy(pool:NodePool, node:int, player:int):
+    """
+    select the child the maximize the UCB score
+    """
+    best_child_found = node
+    upper_confidence_bound = -np.inf
+    child = pool.first_child[node]
+    while child != NO_NODE:
+        value = uct(pool, child, pool.n_simulations[node], player)
+        if value > upper_confidence_bound:
+            upper_confidence_bound = value
+            best_child_found = child
+        child = pool.next_sibling[child]
+    return best_child_found
+
+@njit(nogil=True)
+def add_child(pool:NodePool, node:int, board, thread:int=0):
+    """
+    Add the child of the next untried action of the node (board is the board of the node)
+    Returns the child or NO_NODE if the pool is full
+    The child is linked to the node once it is initialized
+    """
+    index = pool.n_children[node]
+    child = pool.allocate(node, board.get_nth_action_code(index), thread)
+    if child == NO_NODE:
+        return NO_NODE
+    pool.n_children[node] = index + 1
+    pool.next_sibling[child] = pool.first_child[node]
+    pool.first_child[node] = child
+    return child
+
+@njit(nogil=True)
+def expand(pool:NodePool, node:int, board, thread:int=0):
+    """
+    Add all the untried children of the node (used for the root)
+    Returns false if the pool is full
+    """
+    while pool.n_children[node] < board.n_actions:
+        if add_child(pool, node, board, thread) == NO_NODE:
+            return False
+    return True
+
+@njit(nogil=True)
+def backpropagate(pool:NodePool, node:int, utility:float, virtual_loss:float=0.0):
+    """
+    backpropagate the utility of the simulation up to the root
+    The visit was already counted when the virtual loss was applied
+    """
+    while node != NO_NODE:
+        if virtual_loss == 0.0:
+            pool.n_simulations[node] += 1
+        pool.utility[node] += utility + virtual_loss
+        node = pool.parent[node]
+
+@njit(nogil=True)
+def apply_virtual_loss(pool:NodePool, node:int, virtual_loss:float):
+    """
+    Count a visit with a loss for the node so other threads select other nodes
+    """
+    pool.n_simulations[node] += 1
+    pool.utility[node] -= virtual_loss
+
+@njit(nogil=True)
+def run_iterations(pool:NodePool, root_board, player:int, n_iterations:int, virtual_loss:float=0.0,
+                   thread:int=0):
+    """
+    Run n_iterations of selection, expansion, simulation and backpropagation
+    The board of a node is obtained by playing the actions from the root
+    virtual_loss is the utility removed from the nodes (in the point of view
+    of player) while the simulation is running, 0.0 for a single thread
+    """
+    loss = virtual_loss * player
+    for _ in range(n_iterations):
+        board = root_board.clone()
+        node = ROOT
+        if loss != 0.0:
+            apply_virtual_loss(pool, node, loss)
+        # a node is expanded once it has been simulated (the root is always expanded)
+        visited = True
+        while visited and board.n_actions > 0:
+            if pool.n_children[node] < board.n_actions:
+                child = add_child(pool, node, board, thread)
+                if child != NO_NODE:
+                    node = child
+                    board.play_code(pool.action[node])
+                    if loss != 0.0:
+                        apply_virtual_loss(pool, node, loss)
+                break
+            node = tree_policy(pool, node, player)
+            board.play_code(pool.action[node])
+            visited = pool.n_simulations[node] != 0
+            if loss != 0.0:
+                apply_virtual_loss(pool, node, loss)
+
+        backpropagate(pool, node, random_rollout(board), loss)
+
+@njit(nogil=True)
+def best_action(pool:NodePool):
+    """
+    returns the action code of the most simulated child of the root
+    """
+    best_child_found = pool.first_child[ROOT]
+    child = best_child_found
+    while child != NO_NODE:
+        if pool.n_simulations[child] > pool.n_simulations[best_child_found]:
+            best_child_found = child
+        child = pool.next_sibling[child]
+    return pool.action[best_child_found]
+
+def report_overflows(pool:NodePool):
+    """
+    Print a warning if some nodes could not be allocated during the search
+    """
+    if pool.overflows > 0:
+        print(f"NodePool full ({pool.capacity} nodes): {pool.overflows} expansions skipped")
+
+@njit()
+def children_visits(pool:NodePool, node:int=ROOT):
+    """
+    Returns the number of simulations of each child of the node
+    """
+    visits = []
+    child = pool.first_child[node]
+    while child != NO_NODE:
+        visits.append(pool.n_simulations[child])
+        child = pool.next_sibling[child]
+    return np.array(visits, dtype=np.int64)
+
+def root_statistics(pool:NodePool):
+    """
+    Returns the action code, number of simulations and utility of each child of the root
+    """
+    statistics = []
+    child = pool.first_child[ROOT]
+    while child != NO_NODE:
+        statistics.append((pool.action[child], pool.n_simulations[child], pool.utility[child]))
+        child = pool.next_sibling[child]
+    return statistics
+
+def monte_carlo_pool_algo(board, player:int, stop_condition, time_left:int, capacity:int=DEFAULT_CAPACITY,
+                          pool:NodePool=None):
+    """
+    Hold the algorithm of monte-carlo tree search over a NodePool
+    pool can be given to read the statistics of the tree after the search
+    """
+    start_time = time()
+    if pool is None:
+        pool = NodePool(capacity)
+    expand(pool, ROOT, board)
+    if pool.first_child[ROOT] == NO_NODE:
+        return None
+
+    while not stop_condition(start_time, time(), time_left):
+        run_iterations(pool, board, player, ITERATIONS_PER_BATCH)
+
+    report_overflows(pool)
+    return best_action(pool)
+
+def search_thread(pool:NodePool, board, player:int, stop_condition, start_time:float, time_left:int,
+                  virtual_loss:float, thread:int):
+    """
+    Run iterations on the shared tree until the stop condition is reached
+    """
+    while not stop_condition(start_time, time(), time_left):
+        run_iterations(pool, board, player, ITERATIONS_PER_BATCH, virtual_loss, thread)
+
+def monte_carlo_tree_parallel_algo(board, player:int, stop_condition, time_left:int, n_threads:int,
+                                   capacity:int=DEFAULT_CAPACITY, virtual_loss:float=DEFAULT_VIRTUAL_LOSS,
+                                   pool:NodePool=None):
+    """
+    Hold the algorithm of monte-carlo tree search with n_threads threads
+    sharing the same NodePool (pool must have been created for n_threads threads)
+    """
+    start_time = time()
+    if pool is None:
+        pool = NodePool(capacity, n_threads)
+    expand(pool, ROOT, board)
+    if pool.first_child[ROOT] == NO_NODE:
+        return None
+
+    threads = [Thread(target=search_thread,
+                      args=(pool, board, player, stop_condition, start_time, time_left, virtual_loss, thread))
+               for thread in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report_overflows(pool)
+    return best_action(pool)
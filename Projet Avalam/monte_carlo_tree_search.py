@@ -7,31 +7,16 @@ https://www.analyticsvidhya.com/blog/2019/01/monte-carlo-tree-search-introductio
 """
 
 from time import time
-from numpy import abs as np_abs, inf, floor
+from numpy import abs as np_abs, inf, empty, int64
 from monte_carlo_tree_node import MCTS_Node as Node
-
-TURN_REPARTITION = {
-    1: 5,
-    2: 35,
-    3: 120,
-    4: 100,
-    5: 100,
-    6: 100,
-    7: 100,
-    8: 75,
-    9: 75,
-    10: 60,
-    11: 30,
-    12: 30,
-    13: 30,
-    14: 15,
-    15: 10,
-    16: 5,
-    17: 3,
-    18: 3,
-    19: 2,
-    20: 2
-}
+from njitavalam import encode_action
+from bitavalam import Board as BitBoard
+from transposition_table import TranspositionTable, DEFAULT_MAX_ENTRIES
+from monte_carlo_tree_pool import (NodePool, pool_capacity, monte_carlo_pool_algo,
+                                   monte_carlo_tree_parallel_algo, children_visits)
+from time_manager import TimeManager, is_decision_settled, CHECK_INTERVAL
+from progressive_widening import ProgressiveWidening
+from monte_carlo_rave import MAX_MOVES, update_amaf
 
 def time_condition(start_time:float, current_time:float, time_left:int):
     """
@@ -40,26 +25,148 @@ def time_condition(start_time:float, current_time:float, time_left:int):
     """
     return np_abs(current_time - start_time) > (time_left - 1)
 
-def monte_carlo_tree_search(board, player:int, step:int, time_left:int):
+def settled_condition(root_visits, stop_condition=time_condition):
+    """
+    Returns a stop condition with the same signature as time_condition that
+    also stops the search once the decision at the root is settled (see
+    time_manager.is_decision_settled), so the time saved stays in the credit
+    of the agent for the next turns
+    root_visits -- function returning the number of simulations of each child of the root
+    stop_condition -- condition giving the time limit
+    """
+    initial_simulations = sum(root_visits())
+    last_check = [-CHECK_INTERVAL]
+
+    def condition(start_time:float, current_time:float, time_left:int):
+        if stop_condition(start_time, current_time, time_left):
+            return True
+        elapsed = np_abs(current_time - start_time)
+        if elapsed - last_check[0] < CHECK_INTERVAL:
+            return False
+        last_check[0] = elapsed
+        visits = list(root_visits())
+        # time_condition stops one second before time_left
+        return is_decision_settled(visits, sum(visits) - initial_simulations, elapsed, time_left - 1 - elapsed)
+    return condition
+
+def new_root(board, player:int, bitboard:bool=False):
+    """
+    Returns a new root for the board
+    If bitboard is True, the search is done with the bitboard engine (bitavalam)
+    """
+    if bitboard:
+        board = BitBoard(board.get_percepts(), board.max_height)
+    return Node(board, None, player)
+
+def find_action(before, after):
+    """
+    Returns the action played between two percepts matrix or None
+    """
+    source = None
+    target = None
+    for i, (row_before, row_after) in enumerate(zip(before, after)):
+        for j, (cell_before, cell_after) in enumerate(zip(row_before, row_after)):
+            if cell_before != cell_after:
+                if cell_after == 0:
+                    source = (i, j)
+                else:
+                    target = (i, j)
+    if source is None or target is None:
+        return None
+    return source + target
+
+def reuse_tree(node:Node, board, table:TranspositionTable=None):
+    """
+    Returns the subtree of node (the position after our last move) matching
+    the board after the opponent reply, or None if it is not in the tree.
+    The subtree becomes the root and the rest of the tree is freed.
+    """
+    if node is None:
+        return None
+    action = find_action(node.state.get_percepts(), board.get_percepts())
+    root = node.get_child(encode_action(action)) if action is not None else None
+    # the board of the new root is built here, before its parent is freed
+    if root is None or root.state.key != board.key:
+        return None
+
+    # keep only the nodes reachable from the new root
+    reachable = {id(root)}
+    stack = [root]
+    while stack:
+        current_node = stack.pop()
+        for child in current_node.children:
+            if id(child) not in reachable:
+                reachable.add(id(child))
+                stack.append(child)
+    if table is not None:
+        for key in [key for key, table_node in table.entries.items() if id(table_node) not in reachable]:
+            del table.entries[key]
+    stack = [root]
+    root.parent = None
+    while stack:
+        current_node = stack.pop()
+        for child_action, child in zip(current_node.actions, current_node.children):
+            if child.parent is not None and id(child.parent) not in reachable:
+                child.parent = current_node
+                child.action = child_action
+            if child.parent is current_node:
+                stack.append(child)
+    return root
+
+def monte_carlo_tree_search(board, player:int, step:int, time_left:int, bitboard:bool=False,
+                            table_entries:int=DEFAULT_MAX_ENTRIES, array_tree:bool=False,
+                            root:Node=None, table:TranspositionTable=None, n_threads:int=1,
+                            n_rollouts:int=1, time_manager:TimeManager=None,
+                            widening:ProgressiveWidening=None, rave_bias:float=None):
     """
-    Returns best action from monte-carlo tree search
+    Returns the code of the best action from monte-carlo tree search (njitavalam.encode_action)
+    If bitboard is True, the search is done with the bitboard engine (bitavalam)
+    table_entries is the maximum number of entries of the transposition table (0 to disable it)
+    If array_tree is True, the tree is stored in a NodePool (monte_carlo_tree_pool)
+    root and table can be given to continue the search of a previous turn (see reuse_tree)
+    If n_threads is greater than 1, the threads share the same NodePool (tree parallelism)
+    n_rollouts is the number of playouts done for each leaf
+    The time of the turn is given by time_manager (see time_manager.TimeManager)
+    If widening is given, the children are admitted progressively (object tree only)
+    If rave_bias is given, the selection blends UCT with the RAVE statistics (object tree only)
     """
-    turn_number = floor(step/2) + step%2
-    if turn_number in TURN_REPARTITION:
-        time_left = TURN_REPARTITION[turn_number]
+    if time_manager is None:
+        time_manager = TimeManager()
 
-    root = Node(board, None, player)
-    return monte_carlo_algo(root, player, time_condition, step, time_left)
+    if array_tree or n_threads > 1:
+        if bitboard:
+            board = BitBoard(board.get_percepts(), board.max_height)
+        # the search never lasts more than extension times the budget of the turn
+        time_budget = time_manager.extension * time_manager.turn_budget(time_left, board.n_actions)
+        pool = NodePool(pool_capacity(time_budget, n_threads), n_threads)
+        time_manager.start(time_left, board.n_actions, lambda: children_visits(pool))
+        if n_threads > 1:
+            return monte_carlo_tree_parallel_algo(board, player, time_manager.stop_condition,
+                                                  time_manager.maximum, n_threads, pool=pool)
+        return monte_carlo_pool_algo(board, player, time_manager.stop_condition, time_manager.maximum, pool=pool)
 
-def tree_policy(node:Node, player:int):
+    if table is None and table_entries > 0:
+        table = TranspositionTable(table_entries)
+    if root is None:
+        root = new_root(board, player, bitboard)
+    time_manager.start(time_left, board.n_actions, lambda: [child.n_simulations for child in root.children])
+    return monte_carlo_algo(root, player, time_manager.stop_condition, step, time_manager.maximum,
+                            table, n_rollouts, widening, rave_bias)
+
+def tree_policy(node:Node, player:int, widening:ProgressiveWidening=None):
     """
     select the node the maximize the UCB score
+    with widening, only the children admitted by its schedule are considered
     """
     children:list[Node] = node.children
+    n_children = len(children)
+    if widening is not None:
+        n_children = min(n_children, widening.n_children(node.n_simulations))
     best_child_found:Node = None
     upper_confidence_bound = -inf
-    for child in children:
-        uct = child.UCT(player)
+    for index in range(n_children):
+        child = children[index]
+        uct = child.UCT(player, node.n_simulations)
         if uct > upper_confidence_bound:
             upper_confidence_bound = uct
             best_child_found = child
@@ -69,32 +176,96 @@ def tree_policy(node:Node, player:int):
 
     return best_child_found
 
+def rave_policy(node:Node, player:int, bias:float, widening:ProgressiveWidening=None):
+    """
+    Returns the index of the child maximizing the UCT value blended with the
+    RAVE statistics of the node (see MCTS_Node.RAVE)
+    """
+    node.allocate_amaf()
+    n_children = len(node.children)
+    if widening is not None:
+        n_children = min(n_children, widening.n_children(node.n_simulations))
+    best_index = 0
+    upper_confidence_bound = -inf
+    for index in range(n_children):
+        code = node.actions[index]
+        value = node.children[index].RAVE(player, node.n_simulations, node.amaf_n[code],
+                                          node.amaf_utility[code], bias)
+        if value > upper_confidence_bound:
+            upper_confidence_bound = value
+            best_index = index
+    return best_index
+
 def best_action(root: Node, player:int, step:int):
     """
     returns the best action to take
     """
 
-    best_child:Node = root.best_child()
+    action, best_child = root.best_child()
     if best_child is None:
-        return root.rollout_policy(root.state, player, step)
-    return best_child.state.last_action
+        return root.rollout_policy(root.state)
+    return action
+
+def backpropagate(path:list[Node], utility, n_simulations:int=1):
+    """
+    backpropagate the utility of the simulations along the path followed
+    (a node can have many parents when the transposition table is used)
+    """
+    for node in path:
+        node.increment(utility, n_simulations)
 
-def monte_carlo_algo(root:Node, player: int, stop_condition, step:int, time_left:int):
+def monte_carlo_algo(root:Node, player: int, stop_condition, step:int, time_left:int,
+                     table:TranspositionTable=None, n_rollouts:int=1, widening:ProgressiveWidening=None,
+                     rave_bias:float=None):
     """
     Hold the algorithm of monte-carlo tree search
+    Each leaf is evaluated with n_rollouts playouts
+    With widening, the children are sorted by prior and admitted progressively
+    With rave_bias, the nodes keep RAVE statistics used by the selection and
+    each leaf is evaluated with a single playout
     """
     start_time = time()
-    root.expand()
+    prior = None if widening is None else widening.prior
+    # codes of the actions played from the root in an iteration
+    codes = None if rave_bias is None else empty(MAX_MOVES, dtype=int64)
+    if table is not None:
+        table.store(root.key, root)
+    root.expand(table, prior)
 
     while not stop_condition(start_time, time(), time_left):
         current_node = root
+        path = [root]
+        n_moves = 0
         while not current_node.is_leaf:
-            current_node = tree_policy(current_node, player)
+            if codes is None:
+                current_node = tree_policy(current_node, player, widening)
+            else:
+                index = rave_policy(current_node, player, rave_bias, widening)
+                codes[n_moves] = current_node.actions[index]
+                n_moves += 1
+                current_node = current_node.children[index]
+            path.append(current_node)
 
         if current_node.n_simulations != 0:
-            current_node = current_node.expand()
+            parent = current_node
+            current_node = current_node.expand(table, prior)
+            if current_node is not path[-1]:
+                path.append(current_node)
+                if codes is not None:
+                    parent.allocate_amaf()
+                    codes[n_moves] = parent.actions[0]
+                    n_moves += 1
+
+        if codes is None:
+            utility = current_node.rollout(step, n_rollouts)
+            backpropagate(path, utility, n_rollouts)
+            continue
 
-        utility = current_node.rollout(step)
-        current_node.backpropagate(utility)
+        utility, n_moves = current_node.rollout_amaf(codes, n_moves)
+        backpropagate(path, utility)
+        # the player of path[depth] played codes[depth], codes[depth + 2], ...
+        for depth, node in enumerate(path):
+            if node.amaf_n is not None:
+                update_amaf(node.amaf_n, node.amaf_utility, codes, depth, n_moves, utility)
 
     return best_action(root, player, step)
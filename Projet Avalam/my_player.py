@@ -19,16 +19,46 @@ Recherche d'arbre de Monte Carlo
 """
 
 from gc import collect
+from multiprocessing import Pool
+from numpy import array, int64
 from avalam import agent_main
 from njitavalam import Board, PLAYER1
-from monte_carlo_tree_search import monte_carlo_tree_search
+from monte_carlo_tree_search import monte_carlo_tree_search, new_root, reuse_tree
+from monte_carlo_parallel import root_parallel_search
+from transposition_table import TranspositionTable
+from time_manager import TimeManager
 from time_safe_alarm import TimeSafeAgent
+from endgame_solver import solve, ROOT_THRESHOLD
+from progressive_widening import ProgressiveWidening
+from monte_carlo_rave import DEFAULT_RAVE_BIAS
 
 class MonteCarloAgent(TimeSafeAgent):
     """
      Agent based on monte carlo tree search
     """
 
+    def __init__(self, bitboard:bool=False, array_tree:bool=False, tree_reuse:bool=True, n_workers:int=1,
+                 n_threads:int=1, widening:ProgressiveWidening=None, rave_bias:float=None):
+        self.bitboard = bitboard
+        self.array_tree = array_tree
+        self.tree_reuse = tree_reuse
+        self.n_workers = n_workers
+        self.n_threads = n_threads
+        self.widening = widening
+        self.rave_bias = rave_bias
+        self.workers = None
+        self.root = None
+        self.table = TranspositionTable()
+        self.time_manager = TimeManager()
+
+    def initialize(self, percepts, players, time_left):
+        """
+        Begin a new game, the tree of the previous game is discarded
+        """
+        self.root = None
+        self.table.clear()
+        collect()
+
     def get_action(self, board:Board, player:int, step:int, time_left:int):
         """
         Get an action
@@ -36,12 +66,67 @@ class MonteCarloAgent(TimeSafeAgent):
         :param player: the player to control in this step (-1 or 1)
         :param step: the current step
         :param time_left: the time left for the agent to play
-        :return: the action to play
+        :return: the code of the action to play (njitavalam.encode_action)
         """
-        action = monte_carlo_tree_search(board, player, step, time_left)
+        if board.n_actions <= ROOT_THRESHOLD:
+            # the end of the game is small enough to be solved exactly
+            self.root = None
+            return solve(board, player)[1]
+
+        if self.n_workers > 1:
+            if self.workers is None:
+                self.workers = Pool(self.n_workers)
+            return root_parallel_search(self.workers, self.n_workers, board, player, step, time_left,
+                                        bitboard=self.bitboard, array_tree=self.array_tree, seed=step,
+                                        time_manager=self.time_manager)
+
+        if self.array_tree or self.n_threads > 1:
+            return monte_carlo_tree_search(board, player, step, time_left, bitboard=self.bitboard,
+                                           array_tree=True, n_threads=self.n_threads,
+                                           time_manager=self.time_manager)
+
+        root = reuse_tree(self.root, board, self.table) if self.tree_reuse else None
+        self.root = None
+        if root is None or root.player != player:
+            self.table.clear()
+            root = new_root(board, player, self.bitboard)
+        action = monte_carlo_tree_search(board, player, step, time_left, root=root, table=self.table,
+                                         time_manager=self.time_manager, widening=self.widening,
+                                         rave_bias=self.rave_bias)
+        self.root = root.get_child(action)
+        del root
         collect()
         return action
 
+def add_arguments(_, parser):
+    """
+    Add the options of the agent to the command line
+    """
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of processes of the root parallel search (default: %(default)s)")
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="number of threads sharing the search tree (default: %(default)s)")
+    parser.add_argument("--widening", type=float, nargs=2, metavar=("CONSTANT", "EXPONENT"), default=None,
+                        help="admit ceil(CONSTANT * n ** EXPONENT) children ordered by prior in a node "
+                             "with n simulations (default: all children)")
+    parser.add_argument("--rave", type=float, nargs="?", const=DEFAULT_RAVE_BIAS, default=None, metavar="BIAS",
+                        help="blend UCT with RAVE statistics, BIAS is the bias of the AMAF estimate "
+                             "(default: UCT only, %(const)s if BIAS is omitted)")
+
+def setup_agent(agent:MonteCarloAgent, parser, args):
+    """
+    Configure the agent from the command line options
+    """
+    if (args.widening is not None or args.rave is not None) and \
+            (args.workers > 1 or args.threads > 1 or agent.array_tree):
+        parser.error("--widening and --rave only apply to the object tree, "
+                     "they cannot be combined with --workers, --threads or the array tree")
+    agent.n_workers = args.workers
+    agent.n_threads = args.threads
+    if args.widening is not None:
+        agent.widening = ProgressiveWidening(*args.widening)
+    agent.rave_bias = args.rave
+
 if __name__ == "__main__":
     my_agent = MonteCarloAgent()
     percepts = { "m":[ [ 0,  0,  1, -1,  0,  0,  0,  0,  0],
@@ -54,9 +139,22 @@ if __name__ == "__main__":
                                 [ 0,  0,  0,  0, -1,  1, -1,  1,  0],
                                 [ 0,  0,  0,  0,  0, -1,  1,  0,  0] ]
                 , "max_height": 5 }
-    my_agent.play(percepts=percepts, player=PLAYER1, step=1, time_left=900)
+    # first move to compile the numba functions before the game
+    my_agent.play(percepts=percepts, player=PLAYER1, step=1, time_left=30)
+    endgame = array([[0, 0, 1, -1] + [0] * 5] + [[0] * 9] * 8, dtype=int64)
+    solve(Board(endgame, 5), PLAYER1)
+
+    def setup_and_warm_up(agent:MonteCarloAgent, parser, args):
+        """
+        Configure the agent, then compile the selection of the options before the game
+        """
+        setup_agent(agent, parser, args)
+        if agent.widening is not None or agent.rave_bias is not None:
+            agent.play(percepts=percepts, player=PLAYER1, step=1, time_left=30)
+            agent.initialize(percepts, None, None)
+
     try:
-        agent_main(my_agent)
+        agent_main(my_agent, add_arguments, setup_and_warm_up)
     except Exception as error: # pylint: disable=broad-except
         print(error)
         print("Error in agent_main")
@@ -2,8 +2,9 @@
   Avalam numba compatible
 """
 
+from numba import njit
 from numba.experimental import jitclass
-from numba.types import int64, optional, Tuple
+from numba.types import int64, int8, uint64, optional, Tuple
 import numpy as np
 
 # (negative for red, positive for yellow)
@@ -13,36 +14,109 @@ PLAYER2 = -1 # red
 YELLOW = PLAYER1
 RED = PLAYER2
 
+# bit of each neighbour (di+1, dj+1) in the tower actions masks
+DIRECTIONS = np.array([(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)])
+DIRECTION_BITS = np.array([[1, 2, 4], [8, 0, 16], [32, 64, 128]])
+# index in DIRECTIONS of each neighbour (di+1, dj+1)
+DIRECTION_INDEX = np.array([[0, 1, 2], [3, -1, 4], [5, 6, 7]])
+BIT_COUNTS = np.array([bin(mask).count("1") for mask in range(256)])
+
+# Zobrist random numbers of each (cell, height, colour), indexed by
+# ZOBRIST[i][j][m[i][j] + ZOBRIST_MAX_HEIGHT]. The seed is fixed so that keys
+# are the same from one process to another.
+ZOBRIST_MAX_HEIGHT = 5
+ZOBRIST = np.random.default_rng(8215).integers(0, 2**64, size=(9, 9, 2*ZOBRIST_MAX_HEIGHT + 1),
+                                               dtype=np.uint64, endpoint=False)
+ZOBRIST[:, :, ZOBRIST_MAX_HEIGHT] = 0
+
+INITIAL_BOARD = np.array([ [ 0,  0,  1, -1,  0,  0,  0,  0,  0],
+                           [ 0,  1, -1,  1, -1,  0,  0,  0,  0],
+                           [ 0, -1,  1, -1,  1, -1,  1,  0,  0],
+                           [ 0,  1, -1,  1, -1,  1, -1,  1, -1],
+                           [ 1, -1,  1, -1,  0, -1,  1, -1,  1],
+                           [-1,  1, -1,  1, -1,  1, -1,  1,  0],
+                           [ 0,  0,  1, -1,  1, -1,  1, -1,  0],
+                           [ 0,  0,  0,  0, -1,  1, -1,  1,  0],
+                           [ 0,  0,  0,  0,  0, -1,  1,  0,  0] ], dtype=np.int64)
+
+# index of the 48 playable cells (-1 for the cells outside the board), the
+# cells are numbered row by row
+CELL_ROWS, CELL_COLUMNS = (array.astype(np.int64) for array in np.nonzero(INITIAL_BOARD))
+N_CELLS = len(CELL_ROWS)
+CELL_INDEX = np.full((9, 9), -1, dtype=np.int64)
+CELL_INDEX[CELL_ROWS, CELL_COLUMNS] = np.arange(N_CELLS)
+
+def _neighbours():
+    neighbours = np.full((N_CELLS, len(DIRECTIONS)), -1, dtype=np.int64)
+    for cell in range(N_CELLS):
+        for direction, (di, dj) in enumerate(DIRECTIONS):
+            i, j = CELL_ROWS[cell] + di, CELL_COLUMNS[cell] + dj
+            if 0 <= i < 9 and 0 <= j < 9:
+                neighbours[cell, direction] = CELL_INDEX[i, j]
+    return neighbours
+
+# NEIGHBOURS[cell][direction] is the playable cell next to cell in
+# DIRECTIONS[direction] or -1
+NEIGHBOURS = _neighbours()
+
+# Zobrist random numbers of each playable cell, CELL_ZOBRIST[cell] is ZOBRIST[i][j]
+CELL_ZOBRIST = ZOBRIST[CELL_ROWS, CELL_COLUMNS]
+EMPTY_BOARD = np.zeros((9, 9), dtype=np.int64)
+
+# an action is coded by the cell of the tower moved and its direction
+N_ACTION_CODES = N_CELLS * len(DIRECTIONS)
+
+@njit()
+def encode_action(action):
+    """Return the code of the action (i1, j1, i2, j2): cell * 8 + direction"""
+    i1, j1, i2, j2 = action # pylint: disable=invalid-name
+    return CELL_INDEX[i1, j1] * 8 + DIRECTION_INDEX[i2 - i1 + 1, j2 - j1 + 1]
+
+@njit()
+def decode_action(code):
+    """Return the action (i1, j1, i2, j2) of a code given by encode_action"""
+    cell = code // 8
+    direction = code % 8
+    i, j = CELL_ROWS[cell], CELL_COLUMNS[cell]
+    return (i, j, i + DIRECTIONS[direction, 0], j + DIRECTIONS[direction, 1])
+
 @jitclass([
     ('max_height', int64),
-    ('initial_board', int64[:,:]),
-    ('m', int64[:,:]),
+    ('cells', int8[:]),
     ('rows', int64),
     ('columns', int64),
-    ('max_height', int64),
     ('last_action', optional(Tuple([int64, int64, int64, int64]))),
+    ('tower_actions', int64[:]),
+    ('n_actions', int64),
+    ('key', uint64),
 ])
 class Board:
 
     """Representation of an Avalam Board.
 
-    self.m is a self.rows by self.columns bi-dimensional array representing the
-    board.  The absolute value of a cell is the height of the tower.  The sign
-    is the color of the top-most counter (negative for red, positive for
-    yellow).
+    self.cells[cell] is the tower on each of the 48 playable cells (see
+    CELL_INDEX). The absolute value of a cell is the height of the tower.  The
+    sign is the color of the top-most counter (negative for red, positive for
+    yellow). self.m is the self.rows by self.columns matrix of the percepts
+    built from self.cells, actions are translated to cells when they are played.
+
+    self.tower_actions[cell] is a mask of the valid moves of the tower on the
+    cell, one bit per direction (see DIRECTIONS), and self.n_actions the
+    number of valid actions. They are kept up to date by play_action, so
+    self.cells must not be modified directly (call index_actions() otherwise).
+
+    The search algorithms use the action codes of encode_action
+    (get_action_codes, get_nth_action_code, play_code), the 4-uples are only
+    used by the game.
+
+    self.key is the Zobrist key of the position. It only depends on
+    self.cells, so it is the same for a clone or for a board built from the
+    inverted percepts with invert=True. Since every move removes a tower, the
+    position also determines the player to move.
     """
 
-    def __init__(self, percepts=np.array([ [ 0,  0,  1, -1,  0,  0,  0,  0,  0],
-                                [ 0,  1, -1,  1, -1,  0,  0,  0,  0],
-                                [ 0, -1,  1, -1,  1, -1,  1,  0,  0],
-                                [ 0,  1, -1,  1, -1,  1, -1,  1, -1],
-                                [ 1, -1,  1, -1,  0, -1,  1, -1,  1],
-                                [-1,  1, -1,  1, -1,  1, -1,  1,  0],
-                                [ 0,  0,  1, -1,  1, -1,  1, -1,  0],
-                                [ 0,  0,  0,  0, -1,  1, -1,  1,  0],
-                                [ 0,  0,  0,  0,  0, -1,  1,  0,  0] ]),
-                       max_height=5,
-                       invert=False) -> None:
+    def __init__(self, percepts=INITIAL_BOARD, max_height=5, invert=False,
+                 cells=None, tower_actions=None, n_actions=0, key=0) -> None:
         """Initialize the board.
 
         Arguments:
@@ -50,29 +124,32 @@ class Board:
         invert -- whether to invert the sign of all values, inverting the
             players
         max_height -- maximum height of a tower
+        cells, tower_actions, n_actions, key -- state of a board to copy
+            instead of reading the percepts (used by clone)
 
         """
-        # standard avalam
-        self.max_height = 5
-        self.initial_board =  np.array([ [ 0,  0,  1, -1,  0,  0,  0,  0,  0],
-                                [ 0,  1, -1,  1, -1,  0,  0,  0,  0],
-                                [ 0, -1,  1, -1,  1, -1,  1,  0,  0],
-                                [ 0,  1, -1,  1, -1,  1, -1,  1, -1],
-                                [ 1, -1,  1, -1,  0, -1,  1, -1,  1],
-                                [-1,  1, -1,  1, -1,  1, -1,  1,  0],
-                                [ 0,  0,  1, -1,  1, -1,  1, -1,  0],
-                                [ 0,  0,  0,  0, -1,  1, -1,  1,  0],
-                                [ 0,  0,  0,  0,  0, -1,  1,  0,  0] ])
-        self.m = percepts # pylint: disable=invalid-name
-        self.rows = len(self.m)
-        self.columns = len(self.m[0])
+        self.rows = len(percepts)
+        self.columns = len(percepts[0])
         self.max_height = max_height
-        self.m = self.get_percepts(invert)  # make a copy of the percepts
         self.last_action = None
+        if cells is None:
+            mul = PLAYER2 if invert else PLAYER1
+            self.cells = np.zeros(N_CELLS, dtype=np.int8)
+            for cell in range(N_CELLS):
+                self.cells[cell] = mul * percepts[CELL_ROWS[cell], CELL_COLUMNS[cell]]
+            self.tower_actions = np.zeros(N_CELLS, dtype=np.int64)
+            self.n_actions = 0
+            self.index_actions()
+            self.key = self.compute_key()
+        else:
+            self.cells = cells.copy()
+            self.tower_actions = tower_actions.copy()
+            self.n_actions = n_actions
+            self.key = key
 
     def __str__(self) -> str:
         def str_cell(i, j):
-            x = self.m[i][j] # pylint: disable=invalid-name
+            x = self.get_cell(i, j) # pylint: disable=invalid-name
             if x:
                 return "%+2d" % x
             else:
@@ -80,9 +157,27 @@ class Board:
         return "\n".join(" ".join(str_cell(i, j) for j in range(self.columns))
                          for i in range(self.rows))
 
+    @property
+    def m(self): # pylint: disable=invalid-name
+        """Matrix representation of the board, built from self.cells"""
+        return self.get_percepts(False)
+
     def clone(self):
-        """Return a clone of this object."""
-        return Board(self.m.copy(), self.max_height, False)
+        """Return a clone of this object (copy of the cells and of the actions masks)."""
+        board = Board(EMPTY_BOARD, self.max_height, False, self.cells, self.tower_actions, self.n_actions, self.key)
+        board.last_action = self.last_action
+        return board
+
+    def get_cell(self, i, j):
+        """Return the value of cell (i,j) as in the percepts matrix"""
+        cell = CELL_INDEX[i, j]
+        if cell < 0:
+            return 0
+        return int64(self.cells[cell])
+
+    def get_cells(self):
+        """Return a copy of the towers of the playable cells"""
+        return self.cells.copy()
 
     def get_percepts(self, invert=False):
         """Return the percepts corresponding to the current state.
@@ -94,10 +189,9 @@ class Board:
         mul = PLAYER1
         if invert:
             mul = PLAYER2
-        percepts = self.m.copy()
-        for i in range(self.rows):
-            for j in range(self.columns):
-                percepts[i][j] *= mul
+        percepts = np.zeros((self.rows, self.columns), dtype=np.int64)
+        for cell in range(N_CELLS):
+            percepts[CELL_ROWS[cell], CELL_COLUMNS[cell]] = mul * self.cells[cell]
         return percepts
 
     def get_towers(self):
@@ -109,34 +203,103 @@ class Board:
         h -- height of the tower (absolute value) and owner (sign)
 
         """
-        for i in range(self.rows):
-            for j in range(self.columns):
-                if self.m[i][j]:
-                    yield (i, j, self.m[i][j])
+        for cell in range(N_CELLS):
+            if self.cells[cell]:
+                yield (CELL_ROWS[cell], CELL_COLUMNS[cell], int64(self.cells[cell]))
+
+    def compute_tower_actions(self, cell):
+        """Return the mask of the valid moves of the tower on cell"""
+        mask = 0
+        h = abs(self.cells[cell]) # pylint: disable=invalid-name
+        if 0 < h < self.max_height:
+            for direction in range(8):
+                neighbour = NEIGHBOURS[cell, direction]
+                if neighbour >= 0 and 0 < abs(self.cells[neighbour]) <= self.max_height - h:
+                    mask |= 1 << direction
+        return mask
+    def update_tower_actions(self, cell):
+        """Recompute the valid moves of the tower on cell and the number of actions"""
+        mask = self.compute_tower_actions(cell)
+        self.n_actions += BIT_COUNTS[mask] - BIT_COUNTS[self.tower_actions[cell]]
+        self.tower_actions[cell] = mask
+
+    def update_neighbourhood(self, cell):
+        """Recompute the valid moves of the tower on cell and of its neighbours"""
+        self.update_tower_actions(cell)
+        for direction in range(8):
+            neighbour = NEIGHBOURS[cell, direction]
+            if neighbour >= 0:
+                self.update_tower_actions(neighbour)
+
+    def index_actions(self):
+        """Recompute the valid moves of all towers"""
+        self.n_actions = 0
+        for cell in range(N_CELLS):
+            self.tower_actions[cell] = 0
+            self.update_tower_actions(cell)
+
+    def compute_key(self):
+        """Return the Zobrist key of the position"""
+        key = np.uint64(0)
+        for cell in range(N_CELLS):
+            key ^= CELL_ZOBRIST[cell, self.cells[cell] + ZOBRIST_MAX_HEIGHT]
+        return key
 
     def get_tower_actions(self, i, j):
         """Yield all actions with moving tower (i,j)"""
-        h = abs(self.m[i][j]) # pylint: disable=invalid-name
-        if 0 < h < self.max_height:
-            i_min = max(0, i-1)
-            j_min = max(0, j-1)
-            i_max = min(8, i+1)
-            j_max = min(8, j+1)
-            for di in range(i_min, i_max+1):
-                for dj in range(j_min, j_max+1):
-                    if h < abs(self.m[di][dj]) + h <= self.max_height:
-                        if di == i and dj == j:
-                            continue
-                        yield (i, j, di, dj)
+        cell = CELL_INDEX[i, j]
+        if cell >= 0:
+            mask = self.tower_actions[cell]
+            for direction in range(8):
+                if mask & (1 << direction):
+                    yield (i, j, i + DIRECTIONS[direction, 0], j + DIRECTIONS[direction, 1])
 
     def get_actions(self):
-        """Yield all valid actions on this board."""
+        """Return all valid actions on this board."""
         actions = []
-        for i, j, _ in self.get_towers():
-            for action in self.get_tower_actions(i, j):
-                actions.append(action)
+        for cell in range(N_CELLS):
+            mask = self.tower_actions[cell]
+            if mask:
+                i, j = CELL_ROWS[cell], CELL_COLUMNS[cell]
+                for direction in range(8):
+                    if mask & (1 << direction):
+                        actions.append((i, j, i + DIRECTIONS[direction, 0], j + DIRECTIONS[direction, 1]))
         return actions
 
+    def get_action_codes(self):
+        """Return the codes of all valid actions (same order as get_actions)."""
+        codes = np.empty(self.n_actions, dtype=np.int64)
+        n = 0
+        for cell in range(N_CELLS):
+            mask = self.tower_actions[cell]
+            if mask:
+                for direction in range(8):
+                    if mask & (1 << direction):
+                        codes[n] = cell * 8 + direction
+                        n += 1
+        return codes
+
+    def get_nth_action_code(self, n):
+        """Return the code of the n-th action of get_actions() without building the list"""
+        for cell in range(N_CELLS):
+            mask = self.tower_actions[cell]
+            if n >= BIT_COUNTS[mask]:
+                n -= BIT_COUNTS[mask]
+                continue
+            for direction in range(8):
+                if mask & (1 << direction):
+                    if n == 0:
+                        return cell * 8 + direction
+                    n -= 1
+        return -1
+
+    def get_nth_action(self, n):
+        """Return the n-th action of get_actions() without building the list"""
+        code = self.get_nth_action_code(n)
+        if code < 0:
+            return (0, 0, 0, 0)
+        return decode_action(code)
+
     def play_action(self, action):
         """Play an action if it is valid.
 
@@ -144,25 +307,77 @@ class Board:
         move and the row and column of the tower to gobble. If the action is
         invalid, raise an InvalidAction exception. Return self.
 
+        """
+        self.play_action_undoable(action)
+        return self
+
+    def play_action_undoable(self, action):
+        """Play an action if it is valid and return the undo token.
+
+        The board can be restored with undo(token) as long as the actions
+        played after it were undone first. The token is the source and target
+        cells, their towers before the action and the previous last action
+        ((-1, -1, -1, -1) for None). The source is -1 if the action is invalid.
+
         """
         if not self.is_action_valid(action):
+            last_action = self.last_action
+            if last_action is None:
+                last_action = (-1, -1, -1, -1)
+            return (-1, -1, 0, 0) + last_action
+        return self.play_code_undoable(encode_action(action))
+
+    def play_code(self, code):
+        """Play the action of a code given by get_action_codes(). Return self."""
+        self.play_code_undoable(code)
+        return self
+
+    def play_code_undoable(self, code):
+        """Play the action of a code given by get_action_codes() and return
+        the undo token (see play_action_undoable). The code is not checked."""
+        last_action = self.last_action
+        if last_action is None:
+            last_action = (-1, -1, -1, -1)
+        source = code // 8
+        target = NEIGHBOURS[source, code % 8]
+        h1 = abs(self.cells[source]) # pylint: disable=invalid-name
+        h2 = abs(self.cells[target]) # pylint: disable=invalid-name
+        token = (source, target, int64(self.cells[source]), int64(self.cells[target])) + last_action
+        self.key ^= CELL_ZOBRIST[source, self.cells[source] + ZOBRIST_MAX_HEIGHT]
+        self.key ^= CELL_ZOBRIST[target, self.cells[target] + ZOBRIST_MAX_HEIGHT]
+        if self.cells[source] < 0:
+            self.cells[target] = -(h1 + h2)
+        else:
+            self.cells[target] = h1 + h2
+        self.cells[source] = 0
+        self.key ^= CELL_ZOBRIST[target, self.cells[target] + ZOBRIST_MAX_HEIGHT]
+        self.update_neighbourhood(source)
+        self.update_neighbourhood(target)
+        self.last_action = decode_action(code)
+        return token
+
+    def undo(self, token):
+        """Restore the board as it was before the action of the undo token
+        given by play_action_undoable. Return self."""
+        source, target, source_value, target_value, i1, j1, i2, j2 = token # pylint: disable=invalid-name
+        if source < 0:
             return self
-        i1, j1, i2, j2 = action # pylint: disable=invalid-name
-        h1 = abs(self.m[i1][j1]) # pylint: disable=invalid-name
-        h2 = abs(self.m[i2][j2]) # pylint: disable=invalid-name
-        if self.m[i1][j1] < 0:
-            self.m[i2][j2] = -(h1 + h2)
+        self.key ^= CELL_ZOBRIST[target, self.cells[target] + ZOBRIST_MAX_HEIGHT]
+        self.key ^= CELL_ZOBRIST[source, source_value + ZOBRIST_MAX_HEIGHT]
+        self.key ^= CELL_ZOBRIST[target, target_value + ZOBRIST_MAX_HEIGHT]
+        self.cells[source] = source_value
+        self.cells[target] = target_value
+        self.update_neighbourhood(source)
+        self.update_neighbourhood(target)
+        if i1 < 0:
+            self.last_action = None
         else:
-            self.m[i2][j2] = h1 + h2
-        self.m[i1][j1] = 0
-        self.last_action = action
+            self.last_action = (i1, j1, i2, j2)
         return self
 
     def is_finished(self):
         """Return whether no more moves can be made (i.e., game finished)."""
-        for _ in self.get_actions():
-            return False
-        return True
+        return self.n_actions == 0
 
     def get_score(self):
         """Return a score for this board.
@@ -174,26 +389,23 @@ class Board:
 
         """
         score = 0
-        for i in range(self.rows):
-            for j in range(self.columns):
-                if self.m[i][j] < 0:
+        for cell in range(N_CELLS):
+            if self.cells[cell] < 0:
+                score -= 1
+            elif self.cells[cell] > 0:
+                score += 1
+        if score == 0:
+            for cell in range(N_CELLS):
+                if self.cells[cell] == -self.max_height:
                     score -= 1
-                elif self.m[i][j] > 0:
+                elif self.cells[cell] == self.max_height:
                     score += 1
-        if score == 0:
-            for i in range(self.rows):
-                for j in range(self.columns):
-                    if self.m[i][j] == -self.max_height:
-                        score -= 1
-                    elif self.m[i][j] == self.max_height:
-                        score += 1
         return score
 
     def is_tower_movable(self, i, j):
         """Return wether tower (i,j) is movable"""
-        for _ in self.get_tower_actions(i, j):
-            return True
-        return False
+        cell = CELL_INDEX[i, j]
+        return cell >= 0 and self.tower_actions[cell] != 0
 
     def is_action_valid(self, action):
         """Return whether action is a valid action."""
@@ -204,8 +416,12 @@ class Board:
             i2 >= self.rows or j2 >= self.columns or \
             (i1 == i2 and j1 == j2) or (abs(i1-i2) > 1) or (abs(j1-j2) > 1):
             return False
-        h1 = abs(self.m[i1][j1]) # pylint: disable=invalid-name
-        h2 = abs(self.m[i2][j2]) # pylint: disable=invalid-name
+        source = CELL_INDEX[i1, j1]
+        target = CELL_INDEX[i2, j2]
+        if source < 0 or target < 0:
+            return False
+        h1 = abs(self.cells[source]) # pylint: disable=invalid-name
+        h2 = abs(self.cells[target]) # pylint: disable=invalid-name
         if h1 <= 0 or h1 >= self.max_height or h2 <= 0 or \
                 h2 >= self.max_height or h1+h2 > self.max_height:
             return False
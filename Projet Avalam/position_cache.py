@@ -0,0 +1,96 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Cache des résultats de la recherche minimax.
+Associe (clé de Zobrist du plateau, joueur, profondeur restante) à la valeur
+du sous-arbre, au type de borne de cette valeur et au code du meilleur coup
+(njitavalam.encode_action, -1 sans coup). Le cache
+est borné, l'entrée utilisée le moins récemment est retirée lorsqu'il est
+plein. Il peut être sauvegardé dans un fichier binaire (numpy .npz) pour être
+réutilisé d'une partie à l'autre.
+"""
+
+from collections import OrderedDict
+import numpy as np
+from endgame_solver import EXACT, LOWER_BOUND, UPPER_BOUND
+
+DEFAULT_CAPACITY = 2**18
+
+class PositionCache:
+    """
+    Cache LRU des sous-arbres de la recherche minimax
+    Les valeurs sont du point de vue du joueur jaune (> 0: jaune gagne), comme
+    celles de max_value et min_value.
+    """
+    def __init__(self, capacity:int=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def probe(self, key:int, player:int, depth:int, alpha:float, beta:float):
+        """
+        Returns the value and the best action code of the subtree if the stored result
+        is valid in the window (alpha, beta), None otherwise
+        """
+        entry = self.entries.get((key, player, depth))
+        if entry is None:
+            return None
+        self.entries.move_to_end((key, player, depth))
+        value, flag, move = entry
+        if flag == EXACT or (flag == LOWER_BOUND and value >= beta) or (flag == UPPER_BOUND and value <= alpha):
+            return value, move
+        return None
+
+    def store(self, key:int, player:int, depth:int, value:float, alpha:float, beta:float, move:int):
+        """
+        Store the value of the subtree searched in the window (alpha, beta) and its best action code
+        """
+        if value <= alpha:
+            flag = UPPER_BOUND
+        elif value >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.entries[(key, player, depth)] = (value, flag, move)
+        self.entries.move_to_end((key, player, depth))
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        self.entries.clear()
+
+    def save(self, path:str):
+        """
+        Write the entries, from the least to the most recently used, in a binary file
+        """
+        size = len(self.entries)
+        keys = np.empty(size, dtype=np.uint64)
+        players = np.empty(size, dtype=np.int8)
+        depths = np.empty(size, dtype=np.int8)
+        values = np.empty(size, dtype=np.float64)
+        flags = np.empty(size, dtype=np.int8)
+        moves = np.empty(size, dtype=np.int16)
+        for index, ((key, player, depth), (value, flag, move)) in enumerate(self.entries.items()):
+            keys[index], players[index], depths[index] = key, player, depth
+            values[index], flags[index] = value, flag
+            moves[index] = move
+        np.savez_compressed(path, keys=keys, players=players, depths=depths,
+                            values=values, flags=flags, moves=moves)
+
+    def load(self, path:str):
+        """
+        Add the entries of a file written by save
+        """
+        with np.load(path) as data:
+            for key, player, depth, value, flag, move in zip(data["keys"], data["players"], data["depths"],
+                                                            data["values"], data["flags"], data["moves"]):
+                self.entries[(int(key), int(player), int(depth))] = (
+                    float(value), int(flag), int(move))
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
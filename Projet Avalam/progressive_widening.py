@@ -0,0 +1,60 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Élargissement progressif de la recherche d'arbre de Monte Carlo.
+Les enfants d'un noeud sont triés selon un prior peu coûteux (les règles de
+graveyard/greedy_alog.predict_score) et seuls les meilleurs sont considérés
+par la politique de l'arbre. Le nombre d'enfants admis augmente avec le nombre
+de simulations du noeud: ceil(constant * n_simulations ** exponent).
+"""
+
+from math import ceil
+from numba import njit
+from njitavalam import decode_action
+
+DEFAULT_CONSTANT = 2.0
+DEFAULT_EXPONENT = 0.5
+# prior of an action completing a tower of maximum height of our colour
+COMPLETE_TOWER_PRIOR = 100.0
+
+@njit()
+def action_prior(state, code:int, player:int):
+    """
+    Returns the prior of the action code for player (the higher the better)
+    Completing a tower of maximum height with our colour first, then the
+    highest towers of our colour, capturing a tower of the opponent adds one
+    """
+    i1, j1, i2, j2 = decode_action(code) # pylint: disable=invalid-name
+    source = state.get_cell(i1, j1) * player
+    target = state.get_cell(i2, j2) * player
+    height = abs(source) + abs(target)
+    if source > 0 and height == state.max_height:
+        return COMPLETE_TOWER_PRIOR
+    prior = float(height if source > 0 else -height)
+    if target < 0:
+        prior += 1
+    return prior
+
+class ProgressiveWidening:
+    """
+    Calendrier d'admission des enfants
+    Un noeud avec n simulations considère ses n_children(n) premiers enfants
+    """
+    def __init__(self, constant:float=DEFAULT_CONSTANT, exponent:float=DEFAULT_EXPONENT, minimum:int=1):
+        self.constant = constant
+        self.exponent = exponent
+        self.minimum = minimum
+
+    def n_children(self, n_simulations:int):
+        """
+        Returns the number of children admitted for a node with n_simulations
+        """
+        return max(self.minimum, ceil(self.constant * n_simulations ** self.exponent))
+
+    @staticmethod
+    def prior(state, code:int, player:int):
+        """
+        Returns the prior used to order the children (see action_prior)
+        """
+        return action_prior(state, code, player)
@@ -0,0 +1,120 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Gestion du temps de la recherche d'arbre de Monte Carlo.
+Le temps d'un tour est calculé à partir du temps restant et du nombre de coups
+qu'il reste à jouer (estimé à partir du nombre d'actions valides). La recherche
+est prolongée tant que l'action la plus visitée change et arrêtée dès que
+l'avance de l'action la plus visitée ne peut plus être rattrapée.
+"""
+
+from numpy import sqrt
+
+# time kept for the communication with the game server (seconds)
+SAFETY_MARGIN = 5.0
+# minimum number of moves we expect to play
+MIN_REMAINING_MOVES = 2
+# the budget of a turn is never more than this fraction of the time left
+MAX_FRACTION = 0.25
+# the search can be extended up to EXTENSION times the budget if the best action is unstable
+EXTENSION = 2.0
+# the best action is stable if it did not change in this fraction of the budget
+STABILITY = 0.25
+# seconds between two checks of the root statistics
+CHECK_INTERVAL = 0.1
+
+def is_decision_settled(visits, simulations:int, elapsed:float, remaining_time:float):
+    """
+    Returns true if the most visited child of the root cannot be caught by the
+    runner-up in the simulations expected during the remaining time, or if the
+    root has a single child. A root without children (not expanded yet) is
+    never settled.
+    visits -- number of simulations of each child of the root
+    simulations -- number of simulations done in elapsed seconds
+    """
+    if len(visits) == 0:
+        return False
+    if len(visits) == 1:
+        return True
+    best, runner_up = 0, 0
+    for visit in visits:
+        if visit > best:
+            best, runner_up = visit, best
+        elif visit > runner_up:
+            runner_up = visit
+    if elapsed <= 0 or simulations <= 0:
+        return False
+    return best - runner_up > simulations / elapsed * remaining_time
+
+class TimeManager:
+    """
+    Gestionnaire du temps d'un tour
+    stop_condition a la même signature que monte_carlo_tree_search.time_condition
+    """
+    def __init__(self, safety_margin:float=SAFETY_MARGIN, max_fraction:float=MAX_FRACTION,
+                 extension:float=EXTENSION, stability:float=STABILITY):
+        self.safety_margin = safety_margin
+        self.max_fraction = max_fraction
+        self.extension = extension
+        self.stability = stability
+        self.root_visits = None
+        self.budget = 0.0
+        self.maximum = 0.0
+        self.initial_simulations = 0
+        self.best_index = -1
+        self.last_change = 0.0
+        self.last_check = -CHECK_INTERVAL
+
+    @staticmethod
+    def remaining_moves(n_actions:int):
+        """
+        Returns the estimated number of moves we still have to play
+        (about 17 at the start of the game with 292 actions)
+        """
+        return max(MIN_REMAINING_MOVES, sqrt(n_actions))
+
+    def turn_budget(self, time_left:float, n_actions:int):
+        """
+        Returns the time normally allowed for this turn
+        """
+        available = max(0.0, time_left - self.safety_margin)
+        return min(available / self.remaining_moves(n_actions), self.max_fraction * available)
+
+    def start(self, time_left:float, n_actions:int, root_visits=None):
+        """
+        Start a turn
+        root_visits is a function returning the number of simulations of each
+        child of the root, without it the search always uses the budget
+        """
+        self.root_visits = root_visits
+        self.budget = self.turn_budget(time_left, n_actions)
+        self.maximum = min(self.extension * self.budget, self.max_fraction * max(0.0, time_left - self.safety_margin))
+        self.best_index = -1
+        self.last_change = 0.0
+        self.last_check = -CHECK_INTERVAL
+        self.initial_simulations = sum(root_visits()) if root_visits is not None else 0
+
+    def stop_condition(self, start_time:float, current_time:float, _time_left:float=None):
+        """
+        Returns true if the search of this turn must stop
+        """
+        elapsed = abs(current_time - start_time)
+        if elapsed >= self.maximum:
+            return True
+        if self.root_visits is None:
+            return elapsed >= self.budget
+        if elapsed - self.last_check < CHECK_INTERVAL:
+            return False
+        self.last_check = elapsed
+
+        visits = list(self.root_visits())
+        if is_decision_settled(visits, sum(visits) - self.initial_simulations, elapsed, self.maximum - elapsed):
+            return True
+        best_index = max(range(len(visits)), key=visits.__getitem__)
+        if best_index != self.best_index:
+            self.best_index = best_index
+            self.last_change = elapsed
+
+        # after the budget, continue only while the best action is unstable
+        return elapsed >= self.budget and elapsed - self.last_change >= self.stability * self.budget
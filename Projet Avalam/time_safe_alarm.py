@@ -6,9 +6,9 @@ Polytechnique Montréal
 """
 
 import abc
-from numpy import array, int64
+from numpy import array, int64, integer
 from avalam import Agent
-from njitavalam import Board
+from njitavalam import Board, decode_action
 from graveyard.random_actions import random_action
 
 class TimeSafeAgent(Agent):
@@ -32,6 +32,8 @@ class TimeSafeAgent(Agent):
             if time_left < 2.0:
                 raise Exception("not enough time left")
             action = self.get_action(Board(board_array, percepts['max_height']), player, step, time_left)
+            if isinstance(action, (int, integer)):
+                action = decode_action(action)
             if board_copy.is_action_valid(action):
                 return action
             raise Exception("Invalid action")
@@ -47,6 +49,6 @@ class TimeSafeAgent(Agent):
         :param player: the player to control in this step (-1 or 1)
         :param step: the current step
         :param time_left: the time left for the agent to play
-        :return: the action to play
+        :return: the action to play, as a 4-uple or an action code (njitavalam.encode_action)
         """
         raise NotImplementedError("get_action must be implemented by a subclass")
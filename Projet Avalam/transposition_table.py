@@ -0,0 +1,60 @@
+"""
+Copyright (C) 2022, Elizabeth Michaud 2073093, Nicolas Dépelteau 2083544
+Polytechnique Montréal
+
+Table de transposition de la recherche d'arbre de Monte Carlo.
+Associe la clé de Zobrist d'une position (njitavalam.Board.key) à son noeud
+pour que les positions atteintes par des ordres de coups différents partagent
+leurs statistiques.
+"""
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 2**20
+# Fraction of the entries removed when the table is full
+EVICTION_RATIO = 0.25
+
+class TranspositionTable:
+    """
+    Table de transposition bornée en nombre d'entrées (et non en mémoire).
+    Lorsqu'elle est pleine, les entrées les moins visitées sont retirées. Les
+    noeuds retirés restent dans l'arbre mais ne sont plus partagés, leur
+    mémoire n'est libérée qu'avec l'arbre.
+    """
+    def __init__(self, max_entries:int = DEFAULT_MAX_ENTRIES):
+        self.capacity = max(1, max_entries)
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key:int):
+        """
+        Returns the node of the position or None
+        """
+        return self.entries.get(key)
+
+    def store(self, key:int, node):
+        """
+        Store the node of the position, evicting the least visited nodes if the table is full
+        """
+        self.entries[key] = node
+        if len(self.entries) > self.capacity:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove the least visited entries (selected without sorting the table)
+        """
+        n_evicted = max(1, int(len(self.entries) * EVICTION_RATIO))
+        keys = list(self.entries)
+        visits = np.fromiter((node.n_simulations for node in self.entries.values()),
+                             dtype=np.float64, count=len(keys))
+        for index in np.argpartition(visits, n_evicted - 1)[:n_evicted]:
+            del self.entries[keys[index]]
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        self.entries.clear()